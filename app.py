@@ -3,26 +3,46 @@ from typing import List, Optional, Tuple
 import json
 import math
 
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import QObject, Qt, QTimer, pyqtSignal
 from PyQt6.QtGui import QAction, QColor
 from PyQt6.QtWidgets import (
+    QApplication,
     QMainWindow,
     QTableWidgetItem,
 )
 
-import pandas as pd
-import geopandas as gpd
-
-from core.models import Bin, ExactValue
+from core.classification import classes_to_rgba
+from core.models import Bin, ExactValue, MapSpec
 from core.data_handler import DataHandler
+from core.renderer import Renderer
+from core.state import ARTISTS, CLASSIFICATION, COLORS, LEGEND, SCHEME_TABLES, STATS, TABLE, MapState
 from ui.main_window import UIMainWindow
-from utils.file_operations import save_png, save_svg, save_scheme, load_scheme
+from utils.export_queue import ExportJob, ExportQueue
+from utils.file_operations import save_scheme, load_scheme
+from utils.vector_tiles import export_vector_tiles
 
 import os
 
 BASE_DIR = os.path.dirname(__file__)
 DEFAULT_GEOJSON_PATH = os.path.join(BASE_DIR, "data", "russia.geojson")
 
+EXPORT_HISTORY = 50  # строк в списке экспорта, включая завершённые
+EXPORT_SUFFIXES = {"png": ".png", "svg": ".svg", "pdf": ".pdf", "png8": "_palette.png"}
+EXPORT_STATUS = {
+    "queued": "в очереди",
+    "rendering": "отрисовка",
+    "encoding": "кодирование",
+    "writing": "запись",
+    "done": "готово",
+    "cancelled": "отменено",
+    "failed": "ошибка",
+}
+
+
+class ExportSignals(QObject):
+    # Прогресс задач экспорта приходит из рабочих потоков; сигнал доставляет его в поток GUI
+    progress = pyqtSignal(object)
+
 class ChoroplethApp(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -30,61 +50,140 @@ class ChoroplethApp(QMainWindow):
         self.resize(1200, 800)
 
         self.data_handler = DataHandler()
+        # Версии входов карты и запомненные производные: каждое действие пересчитывает только то, что изменило
+        self.state = MapState()
         self.ui = UIMainWindow(self)
         self.ui.connect_signals(self)
         self.on_open_default_geo(DEFAULT_GEOJSON_PATH)
 
-        self.bins: List[Bin] = []
-        self.exact_values: List[ExactValue] = []
-        self.current_mode = "bins" # "bins" or "exact"
-        self.no_data_color = "#D3D3D3"
-        self.edge_color = "#444444"
-        self.edge_width = 0.4
+        self.spec = MapSpec()
+        self.state.set("mode", self.spec.mode, "scheme")
+        # Renderer текущего слоя; пересоздаётся, когда меняется GeoDataFrame
+        self.renderer: Optional[Renderer] = None
+
+        # Полная детализация возвращается, когда панорамирование/масштабирование затихло
+        self._view_timer = QTimer(self)
+        self._view_timer.setSingleShot(True)
+        self._view_timer.setInterval(300)
+        self._view_timer.timeout.connect(self._on_view_settled)
+
+        # Экспорт в фоне: одна отрисовка на все выбранные форматы
+        self.export_queue = ExportQueue()
+        self._export_items = {}
+        self._export_notify = set()
+        self.export_signals = ExportSignals()
+        self.export_signals.progress.connect(self._on_export_progress)
 
         self._update_style_ui()
 
+    def closeEvent(self, event):
+        # Незавершённые экспорты отменяются; временные файлы удаляются самими задачами
+        self.export_queue.cancel_all()
+        self.export_queue.shutdown(wait=True)
+        self.data_handler.workspace.close()
+        super().closeEvent(event)
+
     def _update_style_ui(self):
-        self.ui.set_no_data_color_button_text(self.no_data_color)
-        self.ui.set_edge_color_button_text(self.edge_color)
-        self.ui.set_edge_width_spinbox_value(self.edge_width)
+        self.ui.set_no_data_color_button_text(self.spec.no_data_color)
+        self.ui.set_edge_color_button_text(self.spec.edge_color)
+        self.ui.set_edge_width_spinbox_value(self.spec.edge_width)
+        self.ui.set_outer_edge_color_button_text(self.spec.outer_edge_color)
+        self.ui.set_outer_edge_width_spinbox_value(self.spec.outer_edge_width)
+        self.ui.set_shared_borders_checked(self.spec.shared_borders)
+        self.ui.set_legend_options(
+            self.spec.legend, self.spec.legend_counts, self.spec.legend_ranges, self.spec.legend_histogram
+        )
 
     # ---------------------- Обработчики ----------------------
     def on_open_geo(self):
-        path = self.ui.get_file_dialog_open_file_name("Открыть геоданные", "GeoData (*.geojson *.json *.shp)")
+        path = self.ui.get_file_dialog_open_file_name("Открыть геоданные", "GeoData (*.geojson *.json *.shp *.gpkg)")
         if not path:
             return
         try:
-            self.data_handler.load_geojson(path)
-            self.ui.get_geo_path_label().setText(Path(path).name)
-            self.ui.clear_geo_key_combobox()
-            cols = self.data_handler.get_gdf_columns()
-            self.ui.add_items_to_geo_key_combobox(cols)
-            if cols:
-                self.ui.set_geo_key_combobox_current_index(0)
-                self.data_handler.set_key_geo(cols[0])
-            self._populate_value_table_from_gdf()
+            bbox, where, columns = self._read_geo_filters()
+            self.data_handler.set_lean(self.ui.is_lean_mode_checked())
+            QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+            try:
+                self.data_handler.load_geojson(path, bbox=bbox, where=where, columns=columns)
+            finally:
+                QApplication.restoreOverrideCursor()
+            self._refresh_layer_ui()
         except ValueError as e:
             self.ui.show_error_message("Ошибка чтения", str(e))
 
+    def _read_geo_filters(self):
+        # Фильтры чтения передаются драйверу: читается только нужная часть файла
+        bbox = None
+        bbox_text = self.ui.get_geo_bbox_text()
+        if bbox_text:
+            try:
+                bbox = tuple(float(v) for v in bbox_text.replace(";", ",").split(","))
+            except ValueError:
+                bbox = ()
+            if len(bbox) != 4 or bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+                raise ValueError("Охват задаётся четырьмя числами: minx, miny, maxx, maxy.")
+        where = self.ui.get_geo_where_text() or None
+        columns = [c.strip() for c in self.ui.get_geo_columns_text().split(",") if c.strip()] or None
+        return bbox, where, columns
+
     def on_open_default_geo(self, path):
         if not path:
             return
         try:
+            self.data_handler.set_lean(self.ui.is_lean_mode_checked())
             self.data_handler.load_geojson(path)
-            self.ui.get_geo_path_label().setText(Path(path).name)
-            self.ui.clear_geo_key_combobox()
-            cols = self.data_handler.get_gdf_columns()
-            self.ui.add_items_to_geo_key_combobox(cols)
-            if cols:
-                self.ui.set_geo_key_combobox_current_index(0)
-                self.data_handler.set_key_geo(cols[0])
-            self._populate_value_table_from_gdf()
+            self._refresh_layer_ui()
         except ValueError as e:
             self.ui.show_error_message("Ошибка чтения", str(e))
 
+    def _refresh_layer_ui(self):
+        layer = self.data_handler.workspace.layers[self.data_handler.get_active_layer_name()]
+        self.ui.set_layer_combobox_items(self.data_handler.get_layer_names(), layer.name)
+        self.ui.get_geo_path_label().setText(Path(layer.path).name)
+
+        key_geo = self.data_handler.get_key_geo()
+        self.ui.cmb_geo_key.blockSignals(True)
+        self.ui.clear_geo_key_combobox()
+        cols = self.data_handler.get_gdf_columns()
+        self.ui.add_items_to_geo_key_combobox(cols)
+        if key_geo in cols:
+            self.ui.set_geo_key_combobox_current_index(cols.index(key_geo))
+        self.ui.cmb_geo_key.blockSignals(False)
+
+        self.state.touch("layer", "values")
+        self.state.set("key", key_geo)
+        self._refresh_value_table()
+        self.ui.set_memory_usage(self.data_handler.get_memory_usage())
+
+    def on_layer_changed(self, name: str):
+        if not name:
+            return
+        try:
+            self.data_handler.activate_layer(name)
+        except ValueError as e:
+            self.ui.show_error_message("Ошибка", str(e))
+            return
+        self._refresh_layer_ui()
+
+    def on_dataset_changed(self, name: str):
+        if not name:
+            return
+        try:
+            self.data_handler.activate_dataset(name)
+        except ValueError as e:
+            self.ui.show_error_message("Ошибка", str(e))
+            return
+        self.ui.get_csv_path_label().setText(name)
+        self._refresh_csv_ui()
+
     def on_geo_key_changed(self, text: str):
+        if not self.state.set("key", text or None):
+            return
         self.data_handler.set_key_geo(text or None)
-        self._populate_value_table_from_gdf()
+        if self.renderer is not None:
+            # Иначе правки таблицы ищут регионы по прежнему полю и ничего не перекрашивают
+            self.renderer.key_col = text or None
+        self._refresh_value_table()
 
     def on_open_csv(self):
         path = self.ui.get_file_dialog_open_file_name("Открыть CSV с показателями", "CSV (*.csv)")
@@ -93,19 +192,22 @@ class ChoroplethApp(QMainWindow):
         try:
             self.data_handler.load_csv(path)
             self.ui.get_csv_path_label().setText(Path(path).name)
-            self.ui.clear_csv_comboboxes()
-            cols = self.data_handler.get_df_values_columns()
-            self.ui.add_items_to_csv_comboboxes(cols)
-
-            key_csv, val_csv = self.data_handler.get_csv_keys()
-            if key_csv:
-                self.ui.cmb_csv_key.setCurrentText(key_csv)
-            if val_csv:
-                self.ui.set_csv_val_combobox_current_index(cols.index(val_csv))
-
+            self._refresh_csv_ui()
         except ValueError as e:
             self.ui.show_error_message("Ошибка чтения", str(e))
 
+    def _refresh_csv_ui(self):
+        self.ui.set_dataset_combobox_items(self.data_handler.get_dataset_names(), self.data_handler.get_active_dataset_name())
+        self.ui.clear_csv_comboboxes()
+        cols = self.data_handler.get_df_values_columns()
+        self.ui.add_items_to_csv_comboboxes(cols)
+
+        key_csv, val_csv = self.data_handler.get_csv_keys()
+        if key_csv:
+            self.ui.cmb_csv_key.setCurrentText(key_csv)
+        if val_csv:
+            self.ui.set_csv_val_combobox_current_index(cols.index(val_csv))
+
     def on_join(self):
         try:
             key_geo = self.ui.get_geo_key_combobox_current_text()
@@ -117,11 +219,19 @@ class ChoroplethApp(QMainWindow):
                 return
 
             self.data_handler.join_data(key_geo, key_csv, val_csv)
-            self._populate_value_table_from_gdf()
+            self.state.touch("layer", "values")
+            self._refresh_value_table()
+            self.ui.set_memory_usage(self.data_handler.get_memory_usage())
             self.ui.show_info_message("Готово", "Данные объединены. Таблица значений обновлена.")
         except ValueError as e:
             self.ui.show_error_message("Ошибка", str(e))
 
+    def _refresh_value_table(self):
+        if self.state.is_current("table", TABLE):
+            return
+        self._populate_value_table_from_gdf()
+        self.state.record("table", TABLE)
+
     def _populate_value_table_from_gdf(self):
         self.ui.block_table_values_signals(True)
         self.ui.clear_table_values()
@@ -150,9 +260,37 @@ class ChoroplethApp(QMainWindow):
             return
 
         region_key_value = self.ui.get_table_values_item(row_idx, 0).text()
+        # Правка пришла из таблицы, а карта перекрашивается на месте — если они были
+        # актуальны до правки, они остаются актуальными и после неё
+        table_current = self.state.is_current("table", TABLE)
+        colors_current = self.state.is_current("facecolors", COLORS)
         self.data_handler.update_gdf_value(region_key_value, val)
+        self.state.touch("values")
+        if table_current:
+            self.state.stamp("table", TABLE)
+        if self._update_region_color(region_key_value, val) and colors_current:
+            self.state.stamp("facecolors", COLORS)
+
+    def _update_region_color(self, region_key_value: str, val: float) -> bool:
+        # Инкрементальная перерисовка: перекрашиваем только изменённые регионы
+        # и выводим их поверх уже отрисованного холста (blit), без полного on_plot
+        gdf = self.data_handler.get_gdf()
+        if self.renderer is None or self.renderer.collection is None or self.renderer.gdf is not gdf:
+            return False
+        rows = self.renderer.rows_for_key(region_key_value)
+        if rows.size == 0:
+            # Ничего не перекрашено — цвета на холсте нельзя считать актуальными
+            return False
+        canvas = self.ui.get_figure_canvas()
+        for bbox in self.renderer.update_rows(rows):
+            canvas.blit(bbox)
+        return True
+
+    def on_bin_edited(self, item: QTableWidgetItem):
+        self.state.touch("scheme")
 
     def on_add_bin(self):
+        self.state.touch("scheme")
         r = self.ui.get_bin_table_row_count()
         self.ui.insert_bin_table_row(r)
         self.ui.set_bin_table_item(r, 0, QTableWidgetItem("0"))
@@ -163,6 +301,7 @@ class ChoroplethApp(QMainWindow):
         r = self.ui.get_selected_bin_row()
         if r >= 0:
             self.ui.remove_bin_table_row(r)
+            self.state.touch("scheme")
 
     def on_pick_color_for_selected_bin(self):
         r = self.ui.get_selected_bin_row()
@@ -178,14 +317,16 @@ class ChoroplethApp(QMainWindow):
 
     def on_mode_changed(self):
         if self.ui.get_radio_bins().isChecked():
-            self.current_mode = "bins"
+            self.spec.mode = "bins"
             self.ui.get_stacked_widget().setCurrentIndex(0) # Show bins table
         else:
-            self.current_mode = "exact"
+            self.spec.mode = "exact"
             self.ui.get_stacked_widget().setCurrentIndex(1) # Show exact values table
-        self.on_plot()
+        if self.state.set("mode", self.spec.mode, "scheme"):
+            self.on_plot()
 
     def on_add_exact_value(self):
+        self.state.touch("scheme")
         r = self.ui.get_exact_table_row_count()
         self.ui.insert_exact_table_row(r)
         self.ui.set_exact_table_item(r, 0, QTableWidgetItem("0"))
@@ -195,6 +336,7 @@ class ChoroplethApp(QMainWindow):
         r = self.ui.get_selected_exact_row()
         if r >= 0:
             self.ui.remove_exact_table_row(r)
+            self.state.touch("scheme")
 
     def on_pick_color_for_selected_exact_value(self):
         r = self.ui.get_selected_exact_row()
@@ -209,6 +351,7 @@ class ChoroplethApp(QMainWindow):
             self.ui.set_exact_table_item(r, 1, QTableWidgetItem(new_hex))
 
     def on_exact_value_edited(self, item: QTableWidgetItem):
+        self.state.touch("scheme")
         if item.column() != 0:
             return
         row_idx = item.row()
@@ -224,15 +367,41 @@ class ChoroplethApp(QMainWindow):
     def on_pick_no_data_color(self):
         current_color = self.ui.btn_no_data_color.text()
         new_color = self.ui.pick_color_button(self.ui.btn_no_data_color, current_color)
-        self.no_data_color = new_color
+        self.spec.no_data_color = new_color
+        self.state.touch("style")
 
     def on_pick_edge_color(self):
         current_color = self.ui.btn_edge_color.text()
         new_color = self.ui.pick_color_button(self.ui.btn_edge_color, current_color)
-        self.edge_color = new_color
+        self.spec.edge_color = new_color
+        self.state.touch("style")
 
     def on_edge_width_changed(self, value: float):
-        self.edge_width = value
+        self.spec.edge_width = value
+        self.state.touch("style")
+
+    def on_pick_outer_edge_color(self):
+        current_color = self.ui.btn_outer_edge_color.text()
+        new_color = self.ui.pick_color_button(self.ui.btn_outer_edge_color, current_color)
+        self.spec.outer_edge_color = new_color
+        self.state.touch("style")
+
+    def on_outer_edge_width_changed(self, value: float):
+        self.spec.outer_edge_width = value
+        self.state.touch("style")
+
+    def on_shared_borders_toggled(self, checked: bool):
+        self.spec.shared_borders = checked
+        self.state.touch("style")
+        self.ui.set_shared_borders_checked(checked)
+
+    def on_legend_options_changed(self):
+        for name, checked in self.ui.get_legend_options().items():
+            setattr(self.spec, name, checked)
+        self.state.touch("legend")
+        # Легенда перерисовывается по уже посчитанной статистике классов, без прохода по данным
+        if self.renderer is not None and self.renderer.collection is not None:
+            self.on_plot()
 
     def on_plot(self):
         gdf = self.data_handler.get_gdf()
@@ -240,135 +409,243 @@ class ChoroplethApp(QMainWindow):
             self.ui.show_warning_message("Нет данных", "Сначала загрузите и объедините геоданные с показателями.")
             return
 
+        if not self.state.is_current("scheme_tables", SCHEME_TABLES):
+            if not self._read_scheme_tables():
+                return
+            self.state.record("scheme_tables", SCHEME_TABLES)
+
+        renderer = self._get_renderer()
+        spec = self.spec
+        classes = self.state.memo("classification", CLASSIFICATION, lambda: renderer.classify(spec))
+        colors = self.state.memo(
+            "colors", COLORS, lambda: classes_to_rgba(classes, spec.class_colors(), spec.no_data_color)
+        )
+        stats = self.state.memo("class_stats", STATS, lambda: renderer.class_stats(spec, classes)) if spec.legend else None
+
+        if renderer.collection is not None and self.state.is_current("artists", ARTISTS):
+            # Слой и стиль те же — достаточно перекрасить уже нарисованные регионы
+            changed = False
+            if not self.state.is_current("facecolors", COLORS):
+                renderer.recolor(spec, colors)
+                self.state.record("facecolors", COLORS)
+                changed = True
+            if not self.state.is_current("legend", LEGEND):
+                renderer.draw_legend(spec, stats)
+                self.state.record("legend", LEGEND)
+                self.ui.get_figure().tight_layout()
+                changed = True
+            if changed:
+                self.ui.get_figure_canvas().draw_idle()
+            return
+
+        # Очищаем предыдущий график
+        self.ui.get_figure().clear()
+        ax = self.ui.get_figure().add_subplot(111)
+
+        renderer.draw(ax, spec, facecolors=colors, stats=stats)
+        self.state.record("artists", ARTISTS)
+        self.state.record("facecolors", COLORS)
+        self.state.record("legend", LEGEND)
+        ax.callbacks.connect("xlim_changed", self._on_view_changed)
+        ax.callbacks.connect("ylim_changed", self._on_view_changed)
+
+        # ax.set_title("Хороплет", fontsize=15)
+
+        self.ui.get_figure().tight_layout()
+        self.ui.get_figure_canvas().draw()
+
+    def _read_scheme_tables(self) -> bool:
         # Считываем интервалы из таблицы
-        self.bins = []
+        bins = []
         for r in range(self.ui.get_bin_table_row_count()):
             try:
                 lower = float(self.ui.get_bin_table_item(r, 0).text())
                 upper = float(self.ui.get_bin_table_item(r, 1).text())
                 color_hex = self.ui.get_bin_table_item(r, 2).text()
-                self.bins.append(Bin(lower, upper, color_hex))
+                bins.append(Bin(lower, upper, color_hex))
             except (ValueError, AttributeError):
                 self.ui.show_warning_message("Ошибка интервалов", f"Некорректные значения в строке интервалов {r+1}. Проверьте числа и цвета.")
-                return
+                return False
+        self.spec.bins = bins
 
-        if not self.bins and self.current_mode == "bins":
+        if not self.spec.bins and self.spec.mode == "bins":
             self.ui.show_warning_message("Нет интервалов", "Добавьте хотя бы один интервал.")
-            return
+            return False
 
         # Считываем точные значения из таблицы
-        self.exact_values = []
-        if self.current_mode == "exact":
+        exact_values = []
+        if self.spec.mode == "exact":
             for r in range(self.ui.get_exact_table_row_count()):
                 try:
                     value = float(self.ui.get_exact_table_item(r, 0).text())
                     color_hex = self.ui.get_exact_table_item(r, 1).text()
-                    self.exact_values.append(ExactValue(value, color_hex))
+                    exact_values.append(ExactValue(value, color_hex))
                 except (ValueError, AttributeError):
                     self.ui.show_warning_message("Ошибка точных значений", f"Некорректные значения в строке точных значений {r+1}. Проверьте числа и цвета.")
-                    return
-            if not self.exact_values:
+                    return False
+            if not exact_values:
                 self.ui.show_warning_message("Нет точных значений", "Добавьте хотя бы одно точное значение.")
-                return
-
-        # Очищаем предыдущий график
-        self.ui.get_figure().clear()
-        ax = self.ui.get_figure().add_subplot(111)
+                return False
+        self.spec.exact_values = exact_values
+        return True
 
-        # Применяем цвета к GeoDataFrame
-        value_col = self.data_handler.get_value_column_name()
-        gdf["__color__"] = gdf[value_col].apply(lambda x:
-            self._get_color_for_value(x, self.bins, self.exact_values, self.no_data_color, self.current_mode)
-        )
-
-        # Рисуем карту
-        gdf.plot(
-            ax=ax,
-            color=gdf["__color__"],
-            edgecolor=self.edge_color,
-            linewidth=self.edge_width,
-            missing_kwds={
-                "color": self.no_data_color,
-                "edgecolor": self.edge_color,
-                "linewidth": self.edge_width,
-                "label": "Нет данных",
-            },
-        )
+    def _get_renderer(self) -> Renderer:
+        gdf = self.data_handler.get_gdf()
+        key_geo = self.data_handler.get_key_geo()
+        if self.renderer is None or self.renderer.gdf is not gdf:
+            if self.renderer is not None:
+                self.renderer.close()
+            self.renderer = Renderer(gdf, self.data_handler.get_value_column_name(), key_geo)
+        self.renderer.key_col = key_geo
+        return self.renderer
+
+    def _on_view_changed(self, ax):
+        if self.renderer is None or ax is not self.renderer.ax:
+            return
+        (xmin, xmax), (ymin, ymax) = sorted(ax.get_xlim()), sorted(ax.get_ylim())
+        width = ax.bbox.width or 1.0
+        self.renderer.set_view(xmin, ymin, xmax, ymax, (xmax - xmin) / width)
+        self._view_timer.start()
+
+    def _on_view_settled(self):
+        # Полная детализация после того, как навигация затихла
+        if self.renderer is None:
+            return
+        self.renderer.restore_full_detail()
+        self.ui.get_figure_canvas().draw_idle()
 
-        ax.set_axis_off()
-        # ax.set_title("Хороплет", fontsize=15)
+    def on_save_png(self):
+        self._save_single("png", "Сохранить карту как PNG", "PNG (*.png)")
 
-        # Легенда
-        # handles = []
-        # labels = []
-        # if self.current_mode == "bins":
-        #     for i, b in enumerate(self.bins):
-        #         label = f"{b.lower} – {b.upper}"
-        #         handles.append(plt.Rectangle((0, 0), 1, 1, fc=b.color_hex))
-        #         labels.append(label)
-        # else: # exact mode
-        #     for i, ev in enumerate(self.exact_values):
-        #         label = f"{ev.value}"
-        #         handles.append(plt.Rectangle((0, 0), 1, 1, fc=ev.color_hex))
-        #         labels.append(label)
-
-        # # Добавляем легенду для отсутствующих данных
-        # handles.append(plt.Rectangle((0, 0), 1, 1, fc=self.no_data_color))
-        # labels.append("Нет данных")
-        #
-        # ax.legend(handles, labels, loc="lower left", bbox_to_anchor=(1, 0))
+    def on_save_indexed_png(self):
+        # Карта в 8-битной палитре схемы: в разы меньше полноцветного PNG
+        self._save_single("png8", "Сохранить карту как PNG с палитрой", "PNG (*.png)")
 
-        self.ui.get_figure().tight_layout()
-        self.ui.get_figure_canvas().draw()
+    def on_save_svg(self):
+        self._save_single("svg", "Сохранить карту как SVG", "SVG (*.svg)")
 
-    def _get_color_for_value(self, value: float, bins: List[Bin], exact_values: List[ExactValue], no_data_color: str, mode: str) -> str:
-        if pd.isna(value):
-            return no_data_color
+    def _save_single(self, fmt: str, title: str, file_filter: str):
+        if not self._check_map_for_export():
+            return
+        path = self.ui.get_file_dialog_save_file_name(title, file_filter)
+        if path:
+            for job in self._submit_export([(fmt, path)]):
+                self._export_notify.add(id(job))
 
-        if mode == "bins":
-            for i, b in enumerate(bins):
-                is_last = (i == len(bins) - 1)
-                if b.contains(value, is_last):
-                    return b.color_hex
-        else: # exact mode
-            for ev in exact_values:
-                if value == ev.value:
-                    return ev.color_hex
+    def on_export_formats(self):
+        if not self._check_map_for_export():
+            return
+        formats = self.ui.get_export_formats()
+        if not formats:
+            self.ui.show_warning_message("Нет форматов", "Отметьте хотя бы один формат экспорта.")
+            return
+        path = self.ui.get_file_dialog_save_file_name("Экспорт карты (имя файла без расширения)", "Все файлы (*)")
+        if not path:
+            return
+        base = str(Path(path).with_suffix("")) if Path(path).suffix.lower() in (".png", ".svg", ".pdf") else path
+        self._submit_export([(fmt, base + EXPORT_SUFFIXES[fmt]) for fmt in formats])
+
+    def on_cancel_export(self):
+        rows = set(self.ui.get_selected_export_rows())
+        for job, item in list(self._export_items.values()):
+            if not job.finished and (not rows or self.ui.lst_exports.row(item) in rows):
+                job.cancel()
+                self._on_export_progress(job)
+
+    def _check_map_for_export(self) -> bool:
+        if self.renderer is None or self.renderer.spec is None or self.renderer.gdf is not self.data_handler.get_gdf():
+            self.ui.show_warning_message("Нет карты", "Сначала постройте карту.")
+            return False
+        return True
+
+    def _submit_export(self, targets: List[Tuple[str, str]]) -> List[ExportJob]:
+        # Экспортируется текущий вид окна: тот же размер фигуры и те же пределы осей
+        ax = self.renderer.ax
+        view = (ax.get_xlim(), ax.get_ylim()) if ax is not None else None
+        figsize = tuple(self.ui.get_figure().get_size_inches())
+        jobs = self.export_queue.submit(
+            self.renderer,
+            self.renderer.spec,
+            targets,
+            dpi=300,
+            figsize=figsize,
+            view=view,
+            progress=self.export_signals.progress.emit,
+        )
+        for job in jobs:
+            self._track_export(job)
+        return jobs
+
+    def _track_export(self, job: ExportJob):
+        # Отслеживаются только незавершённые задачи; в списке остаются последние EXPORT_HISTORY строк
+        self._export_items[id(job)] = (job, self.ui.add_export_item(self._export_text(job)))
+        self._trim_export_list()
+
+    def _trim_export_list(self):
+        self.ui.trim_export_items(EXPORT_HISTORY, [item for _, item in self._export_items.values()])
+
+    def _export_text(self, job: ExportJob) -> str:
+        text = f"{Path(job.path).name} — {EXPORT_STATUS[job.status]}"
+        if not job.finished:
+            text += f" ({job.progress:.0%})"
+        if job.error:
+            text += f": {job.error}"
+        return text
+
+    def _on_export_progress(self, job: ExportJob):
+        entry = self._export_items.get(id(job))
+        if entry is None:
+            return
+        entry[1].setText(self._export_text(job))
+        if not job.finished:
+            return
+        del self._export_items[id(job)]
+        self._trim_export_list()
+        if job.status == "failed":
+            self.ui.show_error_message("Ошибка экспорта", f"Не удалось сохранить {job.path}:\n{job.error}")
+        elif job.status == "done" and id(job) in self._export_notify:
+            if job.fmt == "tiles":
+                self.ui.show_info_message("Сохранено", f"Тайлы сохранены в {job.path} (обновлено тайлов: {job.result})")
+            else:
+                self.ui.show_info_message("Сохранено", f"Карта сохранена в {job.path}")
+        self._export_notify.discard(id(job))
 
-        return no_data_color # Если значение не попало ни в один интервал или точное значение
+    def on_export_tiles(self):
+        gdf = self.data_handler.get_gdf()
+        if gdf is None or self.renderer is None or self.renderer.gdf is not gdf or self.renderer.spec is None:
+            self.ui.show_warning_message("Нет карты", "Сначала постройте карту — в тайлы записываются её классы и цвета.")
+            return
+        path = self.ui.get_file_dialog_save_file_name(
+            "Экспорт векторных тайлов",
+            "MBTiles (*.mbtiles);;Каталог z/x/y.pbf (*)",
+        )
+        if not path:
+            return
+        min_zoom = self.ui.get_int_input("Экспорт векторных тайлов", "Минимальный уровень масштаба:", 0, 0, 22)
+        if min_zoom is None:
+            return
+        max_zoom = self.ui.get_int_input("Экспорт векторных тайлов", "Максимальный уровень масштаба:", max(min_zoom, 8), min_zoom, 22)
+        if max_zoom is None:
+            return
 
-    def on_save_png(self):
-        path = self.ui.get_file_dialog_save_file_name("Сохранить карту как PNG", "PNG (*.png)")
-        if path:
-            save_png(self.ui.get_figure(), path)
-            self.ui.show_info_message("Сохранено", f"Карта сохранена в {path}")
+        properties = self.renderer.properties(self.renderer.spec)
 
-    def on_save_svg(self):
-        path = self.ui.get_file_dialog_save_file_name("Сохранить карту как SVG", "SVG (*.svg)")
-        if path:
-            save_svg(self.ui.get_figure(), path)
-            self.ui.show_info_message("Сохранено", f"Карта сохранена в {path}")
+        # Тайлы кодируются в фоне через очередь экспорта: окно не блокируется, задачу можно отменить
+        job = self.export_queue.submit_task(
+            path,
+            "tiles",
+            lambda report: export_vector_tiles(gdf, properties, path, min_zoom, max_zoom, progress=report),
+            progress=self.export_signals.progress.emit,
+        )
+        self._track_export(job)
+        self._export_notify.add(id(job))
 
     def on_save_scheme(self):
         path = self.ui.get_file_dialog_save_file_name("Сохранить схему", "JSON (*.json)")
         if not path:
             return
 
-        scheme_data = {
-            "mode": self.current_mode,
-            "bins": [{
-                "lower": b.lower,
-                "upper": b.upper,
-                "color_hex": b.color_hex
-            } for b in self.bins],
-            "exact_values": [{
-                "value": ev.value,
-                "color_hex": ev.color_hex
-            } for ev in self.exact_values],
-            "no_data_color": self.no_data_color,
-            "edge_color": self.edge_color,
-            "edge_width": self.edge_width,
-        }
+        scheme_data = self.spec.to_dict()
         save_scheme(scheme_data, path)
         self.ui.show_info_message("Сохранено", f"Схема сохранена в {path}")
 
@@ -379,37 +656,27 @@ class ChoroplethApp(QMainWindow):
 
         try:
             scheme_data = load_scheme(path)
-            self.current_mode = scheme_data.get("mode", "bins")
-
-            self.bins = [
-                Bin(b["lower"], b["upper"], b["color_hex"])
-                for b in scheme_data.get("bins", [])
-            ]
-            self.exact_values = [
-                ExactValue(ev["value"], ev["color_hex"])
-                for ev in scheme_data.get("exact_values", [])
-            ]
-            self.no_data_color = scheme_data.get("no_data_color", "#D3D3D3")
-            self.edge_color = scheme_data.get("edge_color", "#444444")
-            self.edge_width = scheme_data.get("edge_width", 0.4)
+            self.spec = MapSpec.from_dict(scheme_data)
+            self.state.touch("scheme", "style", "legend")
+            self.state.set("mode", self.spec.mode, "scheme")
 
             # Обновляем UI
             self._update_style_ui()
 
             self.ui.tbl_bins.setRowCount(0)
-            for i, b in enumerate(self.bins):
+            for i, b in enumerate(self.spec.bins):
                 self.ui.insert_bin_table_row(i)
                 self.ui.set_bin_table_item(i, 0, QTableWidgetItem(str(b.lower)))
                 self.ui.set_bin_table_item(i, 1, QTableWidgetItem(str(b.upper)))
                 self.ui.set_bin_table_item(i, 2, QTableWidgetItem(b.color_hex))
 
             self.ui.tbl_exact_values.setRowCount(0)
-            for i, ev in enumerate(self.exact_values):
+            for i, ev in enumerate(self.spec.exact_values):
                 self.ui.insert_exact_table_row(i)
                 self.ui.set_exact_table_item(i, 0, QTableWidgetItem(str(ev.value)))
                 self.ui.set_exact_table_item(i, 1, QTableWidgetItem(ev.color_hex))
 
-            if self.current_mode == "bins":
+            if self.spec.mode == "bins":
                 self.ui.get_radio_bins().setChecked(True)
                 self.ui.get_stacked_widget().setCurrentIndex(0)
             else:
@@ -0,0 +1,118 @@
+from pathlib import Path
+from typing import Optional
+import atexit
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+import geopandas as gpd
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "choropleth-designer"
+
+
+def _pid_alive(pid: int) -> bool:
+    if sys.platform == "win32":
+        import ctypes
+
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def run_directory(root: Path) -> Path:
+    # Временный каталог одного запуска: root/run-<pid>-*. Владелец удаляет его сам при закрытии;
+    # каталоги процессов, завершившихся без этого (сбой, kill), удаляются при следующем запуске
+    root.mkdir(parents=True, exist_ok=True)
+    for stale in root.glob("run-*"):
+        pid = stale.name.split("-")[1]
+        if pid.isdigit() and int(pid) != os.getpid() and not _pid_alive(int(pid)):
+            shutil.rmtree(stale, ignore_errors=True)
+    return Path(tempfile.mkdtemp(prefix=f"run-{os.getpid()}-", dir=root))
+
+
+# Дисковый кэш перепроецированных слоёв. Ключ учитывает путь, размер и время
+# изменения исходного файла, так что изменённый файл читается заново.
+# Раздел spill используется рабочим пространством для выгрузки неактивных слоёв: у каждого
+# запуска там свой каталог, который удаляется в close() или при выходе из процесса.
+class LayerCache:
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = Path(directory) if directory else DEFAULT_CACHE_DIR
+        self._spill_dir: Optional[Path] = None
+
+    def _key(self, path: str, **params) -> str:
+        src = Path(path).resolve()
+        st = src.stat()
+        parts = [str(src), str(st.st_size), str(st.st_mtime_ns)]
+        parts += [f"{k}={params[k]!r}" for k in sorted(params)]
+        return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+    def _write(self, target: Path, gdf: gpd.GeoDataFrame):
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+        os.close(fd)
+        try:
+            gdf.to_pickle(tmp)
+            os.replace(tmp, target)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def get(self, path: str, **params) -> Optional[gpd.GeoDataFrame]:
+        try:
+            target = self.directory / "layers" / f"{self._key(path, **params)}.pkl"
+        except OSError:
+            return None
+        if not target.exists():
+            return None
+        try:
+            return pd.read_pickle(target)
+        except Exception:
+            # Повреждённая запись кэша — просто читаем исходный файл заново
+            return None
+
+    def put(self, path: str, gdf: gpd.GeoDataFrame, **params):
+        try:
+            target = self.directory / "layers" / f"{self._key(path, **params)}.pkl"
+            self._write(target, gdf)
+        except Exception as e:
+            print(f"Предупреждение: Не удалось записать слой в кэш:\n{e}")
+
+    @property
+    def spill_dir(self) -> Path:
+        if self._spill_dir is None:
+            self._spill_dir = run_directory(self.directory / "spill")
+            atexit.register(self.close)
+        return self._spill_dir
+
+    def spill(self, token: str, gdf: gpd.GeoDataFrame):
+        self._write(self.spill_dir / f"{token}.pkl", gdf)
+
+    def restore(self, token: str) -> gpd.GeoDataFrame:
+        target = self.spill_dir / f"{token}.pkl"
+        gdf = pd.read_pickle(target)
+        target.unlink(missing_ok=True)
+        return gdf
+
+    def discard(self, token: str):
+        if self._spill_dir is not None:
+            (self._spill_dir / f"{token}.pkl").unlink(missing_ok=True)
+
+    def close(self):
+        # Выгруженные слои живут только в пределах запуска
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+            atexit.unregister(self.close)
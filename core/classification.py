@@ -0,0 +1,37 @@
+from typing import List
+
+import numpy as np
+from matplotlib.colors import to_rgba, to_rgba_array
+
+from core.models import Bin, ExactValue
+
+NO_DATA = -1
+
+
+def classify(values, bins: List[Bin], exact_values: List[ExactValue], mode: str) -> np.ndarray:
+    # Векторный аналог построчного перебора: индекс класса для каждого значения или NO_DATA.
+    # Классы перебираются с конца, чтобы при пересечении побеждал первый подходящий, как и раньше.
+    values = np.asarray(values, dtype="float64")
+    classes = np.full(values.shape, NO_DATA, dtype="int32")
+    valid = ~np.isnan(values)
+
+    if mode == "bins":
+        last = len(bins) - 1
+        for i in range(last, -1, -1):
+            b = bins[i]
+            if i == last:
+                mask = (values >= b.lower) & (values <= b.upper)
+            else:
+                mask = (values >= b.lower) & (values < b.upper)
+            classes[mask & valid] = i
+    else:
+        for i in range(len(exact_values) - 1, -1, -1):
+            classes[(values == exact_values[i].value) & valid] = i
+    return classes
+
+
+def classes_to_rgba(classes: np.ndarray, colors: List[str], no_data_color: str) -> np.ndarray:
+    # Последняя строка палитры — цвет «нет данных», поэтому NO_DATA (-1) попадает прямо в неё
+    palette = np.vstack([to_rgba_array(colors).reshape(-1, 4), to_rgba(no_data_color)])
+    return palette[classes]
+
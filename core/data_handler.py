@@ -1,8 +1,11 @@
-from typing import Optional
+from typing import Optional, Sequence
 import pandas as pd
 import geopandas as gpd
 import math
 
+from core.reader import PROJECTED_CRS, read_layer
+from core.workspace import Workspace, memory_usage_by_column
+
 class DataHandler:
     def __init__(self):
         self.gdf: Optional[gpd.GeoDataFrame] = None
@@ -11,26 +14,84 @@ class DataHandler:
         self.key_csv: Optional[str] = None
         self.val_csv: Optional[str] = None
         self.value_col: str = "__value__"
+        self.lean: bool = False
+        self.workspace = Workspace()
+
+    def set_lean(self, lean: bool):
+        self.lean = lean
+
+    def load_geojson(
+        self,
+        path: str,
+        bbox: Optional[tuple[float, float, float, float]] = None,
+        where: Optional[str] = None,
+        columns: Optional[Sequence[str]] = None,
+    ) -> bool:
+        # Фильтры входят в ключ кэша: разные выборки из одного файла кэшируются отдельно
+        params = {
+            "crs": PROJECTED_CRS,
+            "bbox": tuple(bbox) if bbox is not None else None,
+            "where": where or None,
+            "columns": tuple(columns) if columns else None,
+        }
+        gdf = self.workspace.cache.get(path, **params)
+        if gdf is None:
+            gdf = read_layer(path, bbox=bbox, where=where, columns=columns)
+            self.workspace.cache.put(path, gdf, **params)
 
-    def load_geojson(self, path: str) -> bool:
-        try:
-            gdf = gpd.read_file(path)
-        except Exception as e:
-            raise ValueError(f"Не удалось прочитать файл геоданных:\n{e}")
-        if gdf.empty or "geometry" not in gdf.columns:
-            raise ValueError("В файле не найдены геометрии.")
-
-        try:
-            gdf = gdf.to_crs("EPSG:3995")
-        except Exception as e:
-            print(f"Предупреждение: Не удалось перепроецировать:\n{e}")
+        cols = [c for c in gdf.columns if c != "geometry"]
+        if self.lean and cols:
+            # Сохраняем ранее выбранное поле региона, если оно есть в новом файле
+            key = self.key_geo if self.key_geo in cols else cols[0]
+            gdf = self._compact(gdf, key)
+            cols = [key]
 
+        self._sync_active_layer()
         self.gdf = gdf
-        cols = [c for c in gdf.columns if c != "geometry"]
-        if cols:
-            self.key_geo = cols[0]
+        self.key_geo = cols[0] if cols else None
+        self.workspace.add_layer(path, gdf, self.key_geo)
         return True
 
+    def _sync_active_layer(self):
+        # Перед переключением сохраняем текущее состояние активного слоя в рабочем пространстве
+        if self.gdf is not None and self.workspace.active_layer is not None:
+            self.workspace.update_layer(self.workspace.active_layer, self.gdf, self.key_geo)
+
+    def activate_layer(self, name: str):
+        if name == self.workspace.active_layer:
+            return
+        self._sync_active_layer()
+        layer = self.workspace.activate(name)
+        self.gdf = layer.gdf
+        self.key_geo = layer.key_geo
+
+    def get_layer_names(self) -> list[str]:
+        return self.workspace.get_layer_names()
+
+    def get_active_layer_name(self) -> Optional[str]:
+        return self.workspace.active_layer
+
+    def activate_dataset(self, name: str):
+        self.df_values = self.workspace.activate_dataset(name)
+
+    def get_dataset_names(self) -> list[str]:
+        return self.workspace.get_dataset_names()
+
+    def get_active_dataset_name(self) -> Optional[str]:
+        return self.workspace.active_dataset
+
+    def _compact(self, gdf: gpd.GeoDataFrame, key: str) -> gpd.GeoDataFrame:
+        # Компактный слой: только ключ (Categorical), значения (float32) и геометрия
+        keep = [key]
+        if self.value_col in gdf.columns and self.value_col != key:
+            keep.append(self.value_col)
+        keep.append(gdf.geometry.name)
+        lean = gdf[keep].copy()
+        lean[key] = lean[key].astype(str).str.strip().astype("category")
+        if self.value_col in lean.columns:
+            lean[self.value_col] = lean[self.value_col].astype("float32")
+        return lean
+
     def load_csv(self, path: str) -> bool:
         try:
             df = pd.read_csv(path)
@@ -40,6 +101,7 @@ class DataHandler:
             raise ValueError("CSV пуст или не содержит данных.")
 
         self.df_values = df
+        self.workspace.add_dataset(path, df)
         return True
 
     def join_data(self, key_geo: str, key_csv: str, val_csv: str):
@@ -55,14 +117,25 @@ class DataHandler:
         df_copy[key_csv] = df_copy[key_csv].astype(str).str.strip()
 
         merged = gdf_copy.merge(df_copy[[key_csv, val_csv]], left_on=key_geo, right_on=key_csv, how="left")
-        merged[self.value_col] = pd.to_numeric(merged[val_csv], errors="coerce")
-        self.gdf = merged.drop(columns=[key_csv])
+        merged[self.value_col] = pd.to_numeric(merged[val_csv], errors="coerce").astype("float64")
+        merged = merged.drop(columns=[key_csv])
+        if self.lean:
+            merged = self._compact(merged, key_geo)
+        self.gdf = merged
+        self._sync_active_layer()
 
     def update_gdf_value(self, region_key_value: str, new_value: float):
         if self.gdf is None or self.key_geo is None:
             return
+        if self.lean and self.value_col not in self.gdf.columns:
+            self.gdf[self.value_col] = pd.Series(math.nan, index=self.gdf.index, dtype="float32")
         self.gdf.loc[self.gdf[self.key_geo] == region_key_value, self.value_col] = new_value
 
+    def get_memory_usage(self) -> dict[str, int]:
+        if self.gdf is None:
+            return {}
+        return memory_usage_by_column(self.gdf)
+
     def get_gdf_columns(self) -> list[str]:
         if self.gdf is None:
             return []
@@ -0,0 +1,96 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.patches import Patch
+
+from core.classification import NO_DATA
+from core.models import MapSpec
+
+HISTOGRAM_BINS = 32
+
+
+@dataclass
+class ClassStats:
+    # Последняя строка каждого массива — «нет данных», как в палитре classes_to_rgba
+    counts: np.ndarray        # объектов в классе
+    mins: np.ndarray          # наблюдаемый минимум значений класса (nan, если класс пуст)
+    maxs: np.ndarray          # наблюдаемый максимум
+    histogram: np.ndarray     # (классы + 1) x HISTOGRAM_BINS — вклад каждого класса в столбцы гистограммы
+    edges: np.ndarray         # границы столбцов гистограммы
+
+
+def class_stats(classes: np.ndarray, values: np.ndarray, n_classes: int, bins: int = HISTOGRAM_BINS) -> ClassStats:
+    # Один проход bincount по составному индексу «класс × столбец гистограммы»:
+    # суммы по столбцам дают число объектов в классе, строки — гистограмму по классам
+    values = np.asarray(values, dtype="float64")
+    rows = np.where(classes == NO_DATA, n_classes, classes).astype("int64")
+    valid = ~np.isnan(values)
+
+    lo, hi = (values[valid].min(), values[valid].max()) if valid.any() else (0.0, 1.0)
+    edges = np.linspace(lo, hi if hi > lo else lo + 1.0, bins + 1)
+    column = np.zeros(len(values), dtype="int64")
+    column[valid] = np.clip(np.searchsorted(edges, values[valid], side="right") - 1, 0, bins - 1)
+    # Объекты без значения идут в отдельный столбец, чтобы попасть в счётчики, но не в гистограмму
+    column[~valid] = bins
+
+    joint = np.bincount(rows * (bins + 1) + column, minlength=(n_classes + 1) * (bins + 1))
+    joint = joint.reshape(n_classes + 1, bins + 1)
+
+    mins = np.full(n_classes + 1, np.inf)
+    maxs = np.full(n_classes + 1, -np.inf)
+    np.minimum.at(mins, rows[valid], values[valid])
+    np.maximum.at(maxs, rows[valid], values[valid])
+    mins[np.isinf(mins)] = np.nan
+    maxs[np.isinf(maxs)] = np.nan
+
+    return ClassStats(
+        counts=joint.sum(axis=1),
+        mins=mins,
+        maxs=maxs,
+        histogram=joint[:, :bins],
+        edges=edges,
+    )
+
+
+def legend_labels(spec: MapSpec, stats: Optional[ClassStats] = None) -> List[str]:
+    if spec.mode == "bins":
+        labels = [f"{b.lower:g} – {b.upper:g}" for b in spec.bins]
+    else:
+        labels = [f"{ev.value:g}" for ev in spec.exact_values]
+    labels.append("Нет данных")
+    if stats is None:
+        return labels
+
+    result = []
+    for i, label in enumerate(labels):
+        if spec.legend_ranges and not np.isnan(stats.mins[i]):
+            label += f"  [{stats.mins[i]:.4g} … {stats.maxs[i]:.4g}]"
+        if spec.legend_counts:
+            label += f"  ({stats.counts[i]})"
+        result.append(label)
+    return result
+
+
+def draw_legend(ax: Axes, spec: MapSpec, stats: Optional[ClassStats] = None) -> list:
+    # Легенда справа от карты; гистограмма — над ней, столбцы раскрашены по классам.
+    # Возвращает добавленные артисты, чтобы их можно было убрать при перерисовке легенды.
+    colors = spec.class_colors() + [spec.no_data_color]
+    handles = [Patch(facecolor=c, edgecolor=spec.edge_color, linewidth=spec.edge_width) for c in colors]
+    legend = ax.legend(handles, legend_labels(spec, stats), loc="lower left", bbox_to_anchor=(1, 0), frameon=False)
+    artists = [legend]
+
+    if spec.legend_histogram and stats is not None:
+        hist_ax = ax.inset_axes([1.05, 0.6, 0.45, 0.35])
+        width = np.diff(stats.edges)
+        bottom = np.zeros(len(width))
+        for row, color in zip(stats.histogram, colors):
+            hist_ax.bar(stats.edges[:-1], row, width=width, bottom=bottom, align="edge", color=color, linewidth=0)
+            bottom += row
+        hist_ax.set_xlim(stats.edges[0], stats.edges[-1])
+        hist_ax.tick_params(labelsize=7)
+        for side in ("top", "right"):
+            hist_ax.spines[side].set_visible(False)
+        artists.append(hist_ax)
+    return artists
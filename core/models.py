@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import List
 import math
 
 @dataclass
@@ -23,3 +24,71 @@ class ExactValue:
     color_hex: str
 
 
+@dataclass
+class MapSpec:
+    mode: str = "bins" # "bins" or "exact"
+    bins: List[Bin] = field(default_factory=list)
+    exact_values: List[ExactValue] = field(default_factory=list)
+    no_data_color: str = "#D3D3D3"
+    edge_color: str = "#444444"
+    edge_width: float = 0.4
+    outer_edge_color: str = "#444444"
+    outer_edge_width: float = 0.4
+    # Общие границы соседних регионов рисуются один раз отдельной линией
+    shared_borders: bool = False
+    # Легенда и что в ней показывать
+    legend: bool = False
+    legend_counts: bool = False
+    legend_ranges: bool = False
+    legend_histogram: bool = False
+
+    def class_colors(self) -> List[str]:
+        if self.mode == "bins":
+            return [b.color_hex for b in self.bins]
+        return [ev.color_hex for ev in self.exact_values]
+
+    def to_dict(self) -> dict:
+        # Формат совпадает с JSON-файлами схем, сохраняемыми приложением
+        return {
+            "mode": self.mode,
+            "bins": [{
+                "lower": b.lower,
+                "upper": b.upper,
+                "color_hex": b.color_hex
+            } for b in self.bins],
+            "exact_values": [{
+                "value": ev.value,
+                "color_hex": ev.color_hex
+            } for ev in self.exact_values],
+            "no_data_color": self.no_data_color,
+            "edge_color": self.edge_color,
+            "edge_width": self.edge_width,
+            "outer_edge_color": self.outer_edge_color,
+            "outer_edge_width": self.outer_edge_width,
+            "shared_borders": self.shared_borders,
+            "legend": self.legend,
+            "legend_counts": self.legend_counts,
+            "legend_ranges": self.legend_ranges,
+            "legend_histogram": self.legend_histogram,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MapSpec":
+        # В старых схемах нет стиля внешней границы — берём стиль общих границ
+        edge_color = data.get("edge_color", "#444444")
+        edge_width = data.get("edge_width", 0.4)
+        return cls(
+            mode=data.get("mode", "bins"),
+            bins=[Bin(b["lower"], b["upper"], b["color_hex"]) for b in data.get("bins", [])],
+            exact_values=[ExactValue(ev["value"], ev["color_hex"]) for ev in data.get("exact_values", [])],
+            no_data_color=data.get("no_data_color", "#D3D3D3"),
+            edge_color=edge_color,
+            edge_width=edge_width,
+            outer_edge_color=data.get("outer_edge_color", edge_color),
+            outer_edge_width=data.get("outer_edge_width", edge_width),
+            shared_borders=data.get("shared_borders", False),
+            legend=data.get("legend", False),
+            legend_counts=data.get("legend_counts", False),
+            legend_ranges=data.get("legend_ranges", False),
+            legend_histogram=data.get("legend_histogram", False),
+        )
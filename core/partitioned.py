@@ -0,0 +1,292 @@
+from dataclasses import replace
+from io import BytesIO
+from pathlib import Path
+from typing import Iterator, Optional, Union
+import math
+import shutil
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from matplotlib.artist import Artist
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PathCollection
+from matplotlib.figure import Figure
+from matplotlib.transforms import Bbox
+
+from core.cache import DEFAULT_CACHE_DIR, LayerCache, run_directory
+from core.classification import classes_to_rgba, classify
+from core.models import MapSpec
+from core.paths import geometry_paths
+from core.reader import PROJECTED_CRS, iter_layer
+from core.workspace import memory_usage_by_column
+
+DEFAULT_MEMORY_LIMIT = 512 * 2**20
+SAMPLE_ROWS = 1000
+# Во время отрисовки части в памяти одновременно: сама часть, её копия при распаковке
+# из кэша, пути matplotlib и массивы значений/цветов
+PARTITION_OVERHEAD = 4
+NO_MATCH_MESSAGE = "По заданному фильтру не найдено ни одного объекта."
+
+
+def value_index(source: Union[str, pd.DataFrame], key_csv: str, val_csv: str, chunksize: int = 1_000_000) -> pd.Series:
+    # Значения показателя по ключу региона. CSV читается кусками и только двумя нужными столбцами;
+    # ключи и числа приводятся так же, как в DataHandler.join_data
+    try:
+        if isinstance(source, pd.DataFrame):
+            chunks = [source[[key_csv, val_csv]]]
+        else:
+            chunks = pd.read_csv(source, usecols=[key_csv, val_csv], chunksize=chunksize)
+        parts = []
+        for chunk in chunks:
+            keys = chunk[key_csv].astype(str).str.strip()
+            values = pd.to_numeric(chunk[val_csv], errors="coerce").astype("float64")
+            parts.append(pd.Series(values.to_numpy(), index=keys.to_numpy()))
+    except Exception as e:
+        raise ValueError(f"Не удалось прочитать CSV:\n{e}")
+    if not parts:
+        raise ValueError("CSV пуст или не содержит данных.")
+    index = pd.concat(parts)
+    return index[~index.index.duplicated(keep="first")]
+
+
+class ValueTable:
+    # Значения показателя по ключу региона на диске (SQLite во временном каталоге запуска):
+    # CSV любого размера читается кусками один раз, а каждая часть слоя берёт только свои ключи.
+    # Ключи и числа приводятся так же, как в value_index; при повторах остаётся первое значение.
+    def __init__(self, csv_path: str, key_csv: str, val_csv: str, chunksize: int = 1_000_000):
+        self._run_dir: Optional[Path] = run_directory(DEFAULT_CACHE_DIR / "partitions")
+        self.conn = sqlite3.connect(self._run_dir / "values.sqlite")
+        self.conn.execute("CREATE TABLE vals (key TEXT PRIMARY KEY, value REAL)")
+        self.count = 0
+        try:
+            for chunk in pd.read_csv(csv_path, usecols=[key_csv, val_csv], chunksize=chunksize):
+                keys = chunk[key_csv].astype(str).str.strip()
+                values = pd.to_numeric(chunk[val_csv], errors="coerce").astype("float64")
+                self.conn.executemany("INSERT OR IGNORE INTO vals VALUES (?, ?)", zip(keys, values.tolist()))
+                self.count += len(chunk)
+            self.conn.commit()
+        except Exception as e:
+            self.close()
+            raise ValueError(f"Не удалось прочитать CSV:\n{e}")
+        if self.count == 0:
+            self.close()
+            raise ValueError("CSV пуст или не содержит данных.")
+
+    def lookup(self, keys: pd.Series) -> np.ndarray:
+        wanted = pd.unique(keys)
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (key TEXT)")
+        self.conn.execute("DELETE FROM temp.wanted")
+        self.conn.executemany("INSERT INTO temp.wanted VALUES (?)", ((k,) for k in wanted))
+        found = dict(self.conn.execute("SELECT key, value FROM vals WHERE key IN (SELECT key FROM temp.wanted)"))
+        # NaN в SQLite хранится как NULL
+        return keys.map(found).to_numpy(dtype="float64", na_value=math.nan)
+
+    def close(self):
+        if self._run_dir is not None:
+            self.conn.close()
+            shutil.rmtree(self._run_dir, ignore_errors=True)
+            self._run_dir = None
+
+    def __enter__(self) -> "ValueTable":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _lookup(values: Union[pd.Series, ValueTable], keys: pd.Series) -> np.ndarray:
+    if isinstance(values, ValueTable):
+        return values.lookup(keys)
+    return keys.map(values).to_numpy(dtype="float64", na_value=math.nan)
+
+
+class PartitionedLayer:
+    # Слой, который не помещается в память целиком. Первый проход читает файл частями,
+    # перепроецирует их и складывает в дисковый кэш, попутно считая охват; следующие
+    # проходы берут части из кэша. В памяти одновременно только одна часть.
+    # Без явного cache части пишутся в собственный каталог запуска, который удаляет close():
+    # копии слоя больше памяти не должны копиться в общем кэше слоёв.
+    def __init__(
+        self,
+        path: str,
+        key_col: str,
+        bbox: Optional[tuple[float, float, float, float]] = None,
+        where: Optional[str] = None,
+        memory_limit: int = DEFAULT_MEMORY_LIMIT,
+        cache: Optional[LayerCache] = None,
+    ):
+        self.path = path
+        self.key_col = key_col
+        self.bbox = tuple(bbox) if bbox is not None else None
+        self.where = where or None
+        self.partition_rows = self._partition_rows(memory_limit)
+        self._run_dir: Optional[Path] = None
+        if cache is None:
+            self._run_dir = run_directory(DEFAULT_CACHE_DIR / "partitions")
+            cache = LayerCache(str(self._run_dir))
+        self.cache = cache
+        self.num_partitions: Optional[int] = None
+        self.count = 0
+        self.total_bounds: Optional[np.ndarray] = None
+
+    def close(self):
+        if self._run_dir is not None:
+            shutil.rmtree(self._run_dir, ignore_errors=True)
+            self._run_dir = None
+
+    def __enter__(self) -> "PartitionedLayer":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read(self, chunk_size: int) -> Iterator[gpd.GeoDataFrame]:
+        return iter_layer(self.path, bbox=self.bbox, where=self.where, columns=[self.key_col], chunk_size=chunk_size)
+
+    def _partition_rows(self, memory_limit: int) -> int:
+        # Размер части подбирается по выборке из начала файла
+        reader = self._read(SAMPLE_ROWS)
+        sample = next(reader, None)
+        reader.close()
+        if sample is None or sample.empty:
+            raise ValueError(NO_MATCH_MESSAGE if self.bbox is not None or self.where else "В файле не найдены геометрии.")
+        per_row = sum(memory_usage_by_column(sample).values()) / max(len(sample), 1)
+        return max(SAMPLE_ROWS, int(memory_limit / (per_row * PARTITION_OVERHEAD)))
+
+    def _params(self, index: int) -> dict:
+        return {
+            "crs": PROJECTED_CRS,
+            "bbox": self.bbox,
+            "where": self.where,
+            "columns": (self.key_col,),
+            "partition": index,
+            "rows": self.partition_rows,
+        }
+
+    def scan(self):
+        # Первый проход: чтение файла, запись частей в кэш, охват и число объектов
+        bounds = []
+        count = 0
+        index = -1
+        for index, part in enumerate(self._read(self.partition_rows)):
+            self.cache.put(self.path, part, **self._params(index))
+            bounds.append(part.total_bounds)
+            count += len(part)
+        if count == 0:
+            raise ValueError(NO_MATCH_MESSAGE if self.bbox is not None or self.where else "В файле не найдены геометрии.")
+        bounds = np.array(bounds)
+        self.total_bounds = np.r_[bounds[:, :2].min(axis=0), bounds[:, 2:].max(axis=0)]
+        self.count = count
+        self.num_partitions = index + 1
+
+    def partitions(self) -> Iterator[gpd.GeoDataFrame]:
+        if self.num_partitions is None:
+            self.scan()
+        for index in range(self.num_partitions):
+            part = self.cache.get(self.path, **self._params(index))
+            if part is None:
+                # Кэш недоступен (нет места или прав) — дочитываем оставшиеся части из файла
+                for j, part in enumerate(self._read(self.partition_rows)):
+                    if j >= index:
+                        yield part
+                return
+            yield part
+
+
+class _PartitionedCollection(Artist):
+    # Рисует слой частями прямо в renderer: пути каждой части строятся, рисуются
+    # и освобождаются до перехода к следующей. Порядок и свойства те же, что у
+    # единой PathCollection в Renderer.draw, поэтому пиксели совпадают.
+    zorder = PathCollection.zorder
+
+    def __init__(self, layer: PartitionedLayer, values: Union[pd.Series, ValueTable], spec: MapSpec):
+        super().__init__()
+        self.layer = layer
+        self.values = values
+        self.spec = spec
+        self.partitions_drawn = 0
+
+    def get_window_extent(self, renderer=None) -> Bbox:
+        minx, miny, maxx, maxy = self.layer.total_bounds
+        return Bbox([[minx, miny], [maxx, maxy]]).transformed(self.axes.transData)
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        spec = self.spec
+        colors = spec.class_colors()
+        for part in self.layer.partitions():
+            keys = part[self.layer.key_col].astype(str).str.strip()
+            values = _lookup(self.values, keys)
+            classes = classify(values, spec.bins, spec.exact_values, spec.mode)
+            collection = PathCollection(
+                geometry_paths(part.geometry.values),
+                facecolors=classes_to_rgba(classes, colors, spec.no_data_color),
+                edgecolors=spec.edge_color,
+                linewidths=spec.edge_width,
+            )
+            collection.set_figure(self.axes.figure)
+            collection.axes = self.axes
+            collection.set_transform(self.axes.transData)
+            collection.set_clip_path(self.axes.patch)
+            collection.draw(renderer)
+            self.partitions_drawn += 1
+        self.stale = False
+
+
+class PartitionedRenderer:
+    # Аналог Renderer для слоёв больше памяти: та же схема и тот же вид карты,
+    # но слой ни в какой момент не загружается целиком. Общие границы (shared_borders)
+    # требуют топологии всего слоя, поэтому здесь каждый регион обводится сам —
+    # как в Renderer со снятым флажком shared_borders.
+    # values — ValueTable для CSV с диска или Series из value_index для данных в памяти
+    def __init__(self, layer: PartitionedLayer, values: Union[pd.Series, ValueTable]):
+        self.layer = layer
+        self.values = values
+
+    def figure(self, spec: MapSpec, figsize=(6, 6), dpi: int = 100) -> Figure:
+        if self.layer.num_partitions is None:
+            self.layer.scan()
+        fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        ax.add_artist(_PartitionedCollection(self.layer, self.values, replace(spec, shared_borders=False)))
+        minx, miny, maxx, maxy = self.layer.total_bounds
+        ax.update_datalim([(minx, miny), (maxx, maxy)])
+        ax.autoscale_view()
+        ax.set_aspect("equal")
+        ax.set_axis_off()
+        fig.tight_layout()
+        return fig
+
+    def save(self, target, spec: MapSpec, fmt: str = "png", dpi: int = 300, figsize=(6, 6), pad_inches: float = 0.1):
+        fig = self.figure(spec, figsize=figsize)
+        # Охват для bbox_inches считаем сами: при "tight" matplotlib делает лишний
+        # холостой проход отрисовки, а здесь это повторное чтение всех частей.
+        # Слой обрезан по осям и на охват не влияет, так что результат тот же.
+        artist = fig.axes[0].artists[0]
+        artist.set_visible(False)
+        with _dpi(fig, dpi):
+            fig.draw_without_rendering()
+            bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(pad_inches)
+        artist.set_visible(True)
+        fig.savefig(target, format=fmt, dpi=dpi, bbox_inches=bbox)
+
+    def to_bytes(self, spec: MapSpec, fmt: str = "png", dpi: int = 300, figsize=(6, 6)) -> bytes:
+        buf = BytesIO()
+        self.save(buf, spec, fmt=fmt, dpi=dpi, figsize=figsize)
+        return buf.getvalue()
+
+
+class _dpi:
+    def __init__(self, fig: Figure, dpi: int):
+        self.fig, self.dpi = fig, dpi
+
+    def __enter__(self):
+        self.saved = self.fig.dpi
+        self.fig.dpi = self.dpi
+
+    def __exit__(self, *exc):
+        self.fig.dpi = self.saved
@@ -0,0 +1,29 @@
+from typing import List
+
+import numpy as np
+import shapely
+from matplotlib.path import Path
+
+
+def geometry_paths(geoms) -> List[Path]:
+    # Один составной Path на строку слоя (все части мультиполигона и все кольца),
+    # чтобы индекс в коллекции совпадал с позицией строки в GeoDataFrame.
+    geoms = np.asarray(geoms, dtype=object)
+    n = len(geoms)
+    parts, part_row = shapely.get_parts(geoms, return_index=True)
+    rings, ring_part = shapely.get_rings(parts, return_index=True)
+    coords, coord_ring = shapely.get_coordinates(rings, return_index=True)
+
+    codes = np.full(len(coords), Path.LINETO, dtype=Path.code_type)
+    if len(coords):
+        starts = np.flatnonzero(np.r_[True, coord_ring[1:] != coord_ring[:-1]])
+        ends = np.r_[starts[1:], len(coords)] - 1
+        codes[starts] = Path.MOVETO
+        codes[ends] = Path.CLOSEPOLY
+
+    coord_row = part_row[ring_part[coord_ring]]
+    bounds = np.searchsorted(coord_row, np.arange(n + 1))
+    return [
+        Path(coords[bounds[i]:bounds[i + 1]], codes[bounds[i]:bounds[i + 1]])
+        for i in range(n)
+    ]
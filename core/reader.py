@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional, Sequence
+import os
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
+
+PROJECTED_CRS = "EPSG:3995"
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+def _project(gdf: gpd.GeoDataFrame, crs: str) -> gpd.GeoDataFrame:
+    try:
+        return gdf.to_crs(crs)
+    except Exception as e:
+        print(f"Предупреждение: Не удалось перепроецировать:\n{e}")
+        return gdf
+
+
+def read_layer(
+    path: str,
+    bbox: Optional[tuple[float, float, float, float]] = None,
+    where: Optional[str] = None,
+    columns: Optional[Sequence[str]] = None,
+    crs: str = PROJECTED_CRS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: Optional[int] = None,
+) -> gpd.GeoDataFrame:
+    # Фильтры bbox (в СК файла), where и выбор полей передаются в драйвер чтения,
+    # поэтому время и память зависят от размера выборки, а не файла.
+    # Большие выборки читаются параллельно кусками, каждый кусок перепроецируется сразу.
+    columns = list(columns) if columns else None
+    try:
+        if pyogrio is None:
+            gdf = _project(gpd.read_file(path, bbox=bbox, where=where, columns=columns), crs)
+        else:
+            gdf = _read_chunked(path, bbox, where, columns, crs, chunk_size, workers)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Не удалось прочитать файл геоданных:\n{e}")
+
+    if gdf.empty and (bbox is not None or where):
+        raise ValueError("По заданному фильтру не найдено ни одного объекта.")
+    if gdf.empty or "geometry" not in gdf.columns:
+        raise ValueError("В файле не найдены геометрии.")
+    return gdf
+
+
+def _plan_chunks(path, bbox, where, chunk_size) -> list[dict]:
+    # Аргументы чтения для каждого куска; один кусок — чтение целиком с фильтрами
+    info = pyogrio.read_info(path)
+    caps = info.get("capabilities", {})
+    filtered = bbox is not None or bool(where)
+
+    if filtered and caps.get("random_read"):
+        # Сначала дешёвый проход по фильтру (только FID и рамки), затем чтение кусками по FID.
+        # Пустой план — по фильтру ничего не найдено
+        fids = pyogrio.read_bounds(path, bbox=bbox, where=where)[0]
+        return [{"fids": fids[i:i + chunk_size]} for i in range(0, len(fids), chunk_size)]
+    if not filtered and caps.get("fast_set_next_by_index") and info["features"] > 0:
+        total = info["features"]
+        return [{"skip_features": i, "max_features": chunk_size} for i in range(0, total, chunk_size)]
+    return [{"bbox": bbox, "where": where}]
+
+
+def _read_chunked(path, bbox, where, columns, crs, chunk_size, workers) -> gpd.GeoDataFrame:
+    chunks = _plan_chunks(path, bbox, where, chunk_size) or [{"bbox": bbox, "where": where}]
+    if len(chunks) == 1:
+        return _read_chunk(path, columns, crs, chunks[0])
+
+    workers = workers or min(len(chunks), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(lambda kwargs: _read_chunk(path, columns, crs, kwargs), chunks))
+    gdf = pd.concat(parts)
+    if "fids" in chunks[0]:
+        # Порядок строк при чтении по FID не определён — восстанавливаем порядок файла
+        gdf = gdf.sort_index()
+    return gdf.reset_index(drop=True)
+
+
+def iter_layer(
+    path: str,
+    bbox: Optional[tuple[float, float, float, float]] = None,
+    where: Optional[str] = None,
+    columns: Optional[Sequence[str]] = None,
+    crs: str = PROJECTED_CRS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[gpd.GeoDataFrame]:
+    # Последовательное чтение кусками: в памяти одновременно только один кусок.
+    # Куски идут в порядке файла, каждый уже перепроецирован.
+    columns = list(columns) if columns else None
+    try:
+        if pyogrio is None:
+            chunks = [{"bbox": bbox, "where": where}]
+        else:
+            chunks = _plan_chunks(path, bbox, where, chunk_size)
+            if not chunks:
+                raise ValueError("По заданному фильтру не найдено ни одного объекта.")
+            if len(chunks) == 1 and "bbox" in chunks[0]:
+                raise ValueError("Драйвер не поддерживает чтение этого файла по частям.")
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Не удалось прочитать файл геоданных:\n{e}")
+
+    for kwargs in chunks:
+        try:
+            if pyogrio is None:
+                gdf = _project(gpd.read_file(path, bbox=bbox, where=where, columns=columns), crs)
+            else:
+                gdf = _read_chunk(path, columns, crs, kwargs)
+        except Exception as e:
+            raise ValueError(f"Не удалось прочитать файл геоданных:\n{e}")
+        if "fids" in kwargs:
+            gdf = gdf.sort_index().reset_index(drop=True)
+        yield gdf
+
+
+def _read_chunk(path: str, columns, crs: str, kwargs: dict) -> gpd.GeoDataFrame:
+    fid_as_index = "fids" in kwargs
+    if fid_as_index:
+        kwargs = {"fids": np.asarray(kwargs["fids"])}
+    gdf = pyogrio.read_dataframe(path, columns=columns, fid_as_index=fid_as_index, **kwargs)
+    return _project(gdf, crs)
@@ -0,0 +1,356 @@
+from copy import deepcopy
+from io import BytesIO
+from typing import List, Optional
+import math
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PathCollection
+from matplotlib.figure import Figure
+from matplotlib.patches import PathPatch
+from matplotlib.path import Path
+from matplotlib.colors import to_rgba_array
+from matplotlib.transforms import Bbox
+from PIL import Image
+
+from core.classification import classes_to_rgba, classify
+from core.legend import ClassStats, class_stats, draw_legend
+from core.models import MapSpec
+from core.paths import geometry_paths
+from core.topology import Topology, build_topology
+from core.viewport import ArcIndex, ViewportIndex
+
+# Индексы палитрового PNG — один байт на пиксель
+MAX_PALETTE = 256
+
+# Отрисовка хороплета без Qt: слой + значения + схема -> фигура, байты или массив цветов.
+# GUI и скрипты (ноутбуки, сервисы) пользуются одним и тем же кодом.
+class Renderer:
+    def __init__(self, gdf: gpd.GeoDataFrame, value_col: str = "__value__", key_col: Optional[str] = None):
+        self.gdf = gdf
+        self.value_col = value_col
+        self.key_col = key_col
+        self._paths: Optional[List[Path]] = None
+        self._viewport: Optional[ViewportIndex] = None
+        self._topology: Optional[Topology] = None
+        self._arc_indexes: Optional[List[ArcIndex]] = None
+
+        # Состояние последней отрисовки в draw() — для инкрементальных обновлений
+        self.spec: Optional[MapSpec] = None
+        self.ax: Optional[Axes] = None
+        self.collection: Optional[PathCollection] = None
+        self.borders: List[LineCollection] = []
+        self.facecolors: Optional[np.ndarray] = None
+        self.rows: Optional[np.ndarray] = None
+        self.border_rows: List[np.ndarray] = []
+        self.legend_artists: list = []
+
+    @property
+    def paths(self) -> List[Path]:
+        if self._paths is None:
+            self._paths = geometry_paths(self.gdf.geometry.values)
+        return self._paths
+
+    @property
+    def viewport(self) -> ViewportIndex:
+        if self._viewport is None:
+            self._viewport = ViewportIndex(self.gdf.geometry.values, self.paths)
+        return self._viewport
+
+    @property
+    def topology(self) -> Topology:
+        if self._topology is None:
+            self._topology = build_topology(self.gdf.geometry.values)
+        return self._topology
+
+    @property
+    def arc_indexes(self) -> List[ArcIndex]:
+        # Индексы дуг в порядке self.borders: внутренние, затем внешние
+        if self._arc_indexes is None:
+            self._arc_indexes = [ArcIndex(self.topology.internal), ArcIndex(self.topology.external)]
+        return self._arc_indexes
+
+    def close(self):
+        if self._viewport is not None:
+            self._viewport.close()
+        for index in self._arc_indexes or []:
+            index.close()
+
+    # ---------------------- Данные и классы ----------------------
+    def values(self) -> np.ndarray:
+        if self.value_col not in self.gdf.columns:
+            return np.full(len(self.gdf), math.nan)
+        return self.gdf[self.value_col].to_numpy(dtype="float64", na_value=math.nan)
+
+    def classify(self, spec: MapSpec) -> np.ndarray:
+        return classify(self.values(), spec.bins, spec.exact_values, spec.mode)
+
+    def colors(self, spec: MapSpec) -> np.ndarray:
+        return classes_to_rgba(self.classify(spec), spec.class_colors(), spec.no_data_color)
+
+    def class_stats(self, spec: MapSpec, classes: Optional[np.ndarray] = None) -> ClassStats:
+        if classes is None:
+            classes = self.classify(spec)
+        return class_stats(classes, self.values(), len(spec.class_colors()))
+
+    def hex_colors(self, spec: MapSpec) -> np.ndarray:
+        palette = np.array(spec.class_colors() + [spec.no_data_color], dtype=object)
+        return palette[self.classify(spec)]
+
+    def properties(self, spec: MapSpec) -> pd.DataFrame:
+        # Атрибуты объектов для внешних форматов (векторные тайлы и т. п.)
+        classes = self.classify(spec)
+        palette = np.array(spec.class_colors() + [spec.no_data_color], dtype=object)
+        if self.key_col is not None and self.key_col in self.gdf.columns:
+            regions = self.gdf[self.key_col].astype(str).to_numpy()
+        else:
+            regions = np.arange(len(self.gdf)).astype(str)
+        return pd.DataFrame({
+            "region": regions,
+            "value": self.values(),
+            "class": classes,
+            "color": palette[classes],
+        })
+
+    def rows_for_key(self, key_value: str) -> np.ndarray:
+        if self.key_col is None or self.key_col not in self.gdf.columns:
+            return np.array([], dtype=int)
+        return np.flatnonzero((self.gdf[self.key_col].astype(str) == key_value).to_numpy())
+
+    # ---------------------- Отрисовка ----------------------
+    def draw(
+        self,
+        ax: Axes,
+        spec: MapSpec,
+        facecolors: Optional[np.ndarray] = None,
+        stats: Optional[ClassStats] = None,
+    ) -> PathCollection:
+        # Один Path на строку слоя: индекс в коллекции совпадает с позицией строки,
+        # поэтому правка одного значения перекрашивает ровно один элемент.
+        # Готовые цвета (facecolors) и статистику классов можно передать, чтобы не классифицировать заново.
+        self.spec = deepcopy(spec)
+        self.ax = ax
+        self.facecolors = self.colors(spec) if facecolors is None else facecolors.copy()
+        self.rows = np.arange(len(self.gdf))
+        self.border_rows = []
+        if spec.shared_borders:
+            # Заливка без обводки, а границы — по одному разу из топологии слоя:
+            # внутренние не рисуются дважды, и у внешних может быть свой стиль
+            self.collection = PathCollection(self.paths, facecolors=self.facecolors, edgecolors="none", linewidths=0)
+            self.borders = [
+                LineCollection(self.topology.internal, colors=spec.edge_color, linewidths=spec.edge_width),
+                LineCollection(self.topology.external, colors=spec.outer_edge_color, linewidths=spec.outer_edge_width),
+            ]
+        else:
+            self.collection = PathCollection(
+                self.paths,
+                facecolors=self.facecolors,
+                edgecolors=spec.edge_color,
+                linewidths=spec.edge_width,
+            )
+            self.borders = []
+        ax.add_collection(self.collection, autolim=True)
+        for lines in self.borders:
+            ax.add_collection(lines, autolim=False)
+        ax.autoscale_view()
+        if self.gdf.crs is not None and self.gdf.crs.is_geographic:
+            y_coord = np.mean(self.gdf.total_bounds[[1, 3]])
+            ax.set_aspect(1 / np.cos(np.deg2rad(y_coord)))
+        else:
+            ax.set_aspect("equal")
+        ax.set_axis_off()
+        self.legend_artists = []
+        self.draw_legend(spec, stats)
+        return self.collection
+
+    def draw_legend(self, spec: MapSpec, stats: Optional[ClassStats] = None):
+        # Перерисовывает только легенду; карта и её коллекции не трогаются
+        for artist in self.legend_artists:
+            artist.remove()
+        self.legend_artists = []
+        self.spec = deepcopy(spec)
+        if self.ax is None or not spec.legend:
+            return
+        if stats is None and (spec.legend_counts or spec.legend_ranges or spec.legend_histogram):
+            stats = self.class_stats(spec)
+        self.legend_artists = draw_legend(self.ax, spec, stats)
+
+    def detached(self) -> "Renderer":
+        # Копия для отрисовки в отдельную фигуру: общие пути и топология слоя,
+        # но своё состояние draw(), чтобы экспорт не сбивал карту в окне
+        clone = Renderer(self.gdf, self.value_col, self.key_col)
+        clone._paths = self.paths
+        clone._topology = self._topology
+        return clone
+
+    def snapshot(self) -> "Renderer":
+        # Копия с замороженными значениями для фонового экспорта: правки в окне после
+        # постановки в очередь её не касаются. Геометрия, пути и топология общие.
+        columns = [c for c in (self.key_col, self.value_col) if c is not None and c in self.gdf.columns]
+        clone = Renderer(self.gdf[columns + [self.gdf.geometry.name]], self.value_col, self.key_col)
+        clone._paths = self.paths
+        clone._topology = self._topology
+        return clone
+
+    def figure(self, spec: MapSpec, figsize=(6, 6), dpi: int = 100, view=None) -> Figure:
+        # view — пределы осей ((xmin, xmax), (ymin, ymax)), например текущий вид окна
+        fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        self.detached().draw(ax, spec)
+        if view is not None:
+            ax.set_xlim(*view[0])
+            ax.set_ylim(*view[1])
+        fig.tight_layout()
+        return fig
+
+    def to_bytes(self, spec: MapSpec, fmt: str = "png", dpi: int = 300, figsize=(6, 6)) -> bytes:
+        buf = BytesIO()
+        if fmt == "png8":
+            self.save_indexed_png(buf, spec, dpi=dpi, figsize=figsize)
+            return buf.getvalue()
+        fig = self.figure(spec, figsize=figsize)
+        fig.savefig(buf, format=fmt, dpi=dpi, bbox_inches="tight")
+        return buf.getvalue()
+
+    # ---------------------- Индексированная палитра ----------------------
+    def palette(self, spec: MapSpec, background: str = "white") -> np.ndarray:
+        # Все цвета, которые могут оказаться на карте: фон, классы, «нет данных», границы
+        colors = [background] + spec.class_colors() + [spec.no_data_color, spec.edge_color]
+        if spec.shared_borders:
+            colors.append(spec.outer_edge_color)
+        if spec.legend:
+            colors.append("black")  # подписи и оси гистограммы
+        rgba = np.round(to_rgba_array(colors) * 255).astype("uint8")
+        _, first = np.unique(rgba.view("uint32").ravel(), return_index=True)
+        return rgba[np.sort(first)]
+
+    def indexed(
+        self, spec: MapSpec, dpi: int = 300, figsize=(6, 6), pad_inches: float = 0.1, view=None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Карта без сглаживания: каждый пиксель — ровно один цвет схемы, поэтому
+        # буфер Agg переводится в индексы палитры без квантования
+        palette = self.palette(spec)
+        if len(palette) > MAX_PALETTE:
+            raise ValueError(
+                f"В палитровом PNG не больше {MAX_PALETTE} цветов, а схеме вместе с фоном и границами "
+                f"нужно {len(palette)}. Сохраните карту в обычный PNG."
+            )
+        fig = self.figure(spec, figsize=figsize, dpi=dpi, view=view)
+        canvas = fig.canvas
+        for collection in fig.axes[0].collections:
+            collection.set_antialiased(False)
+        canvas.draw()
+        rgba = np.asarray(canvas.buffer_rgba())
+
+        # Обрезка как у savefig(bbox_inches="tight")
+        height = rgba.shape[0]
+        bbox = fig.get_tightbbox(canvas.get_renderer()).padded(pad_inches)
+        x0, x1 = max(int(math.floor(bbox.x0 * dpi)), 0), min(int(math.ceil(bbox.x1 * dpi)), rgba.shape[1])
+        y0, y1 = max(height - int(math.ceil(bbox.y1 * dpi)), 0), min(height - int(math.floor(bbox.y0 * dpi)), height)
+        rgba = np.ascontiguousarray(rgba[y0:y1, x0:x1])
+
+        keys = palette.view("uint32").ravel()
+        order = np.argsort(keys)
+        pixels = rgba.view("uint32")[..., 0]
+        pos = np.clip(np.searchsorted(keys[order], pixels), 0, len(keys) - 1)
+        index = order[pos]
+        stray = keys[index] != pixels
+        if stray.any():
+            # Смешанные цвета (полупрозрачные цвета схемы) — к ближайшему цвету палитры
+            colors, inverse = np.unique(pixels[stray], return_inverse=True)
+            rgb = colors.view("uint8").reshape(-1, 4).astype("int32")
+            dist = ((rgb[:, None, :] - palette[None, :, :].astype("int32")) ** 2).sum(axis=2)
+            index[stray] = dist.argmin(axis=1)[inverse]
+        return index.astype("uint8"), palette
+
+    def save_indexed_png(self, target, spec: MapSpec, dpi: int = 300, figsize=(6, 6), compress_level: int = 6):
+        # Индексы классов сжимаются zlib в разы лучше RGBA; уровень 6 почти не уступает 9
+        # по размеру, но кодирует в несколько раз быстрее
+        index, palette = self.indexed(spec, dpi=dpi, figsize=figsize)
+        encode_indexed_png(target, index, palette, dpi=dpi, compress_level=compress_level)
+
+    # ---------------------- Инкрементальные обновления ----------------------
+    def recolor(self, spec: MapSpec, facecolors: np.ndarray):
+        # Новые цвета для уже нарисованных регионов: коллекции и границы остаются прежними
+        if self.collection is None:
+            return
+        self.spec = deepcopy(spec)
+        self.facecolors = facecolors.copy()
+        self.collection.set_facecolor(self.facecolors[self.rows])
+
+    def update_rows(self, rows: np.ndarray) -> List[Bbox]:
+        # Перекрашивает строки по текущим значениям слоя и рисует их поверх холста.
+        # Возвращает области экрана, которые нужно вывести (blit).
+        if self.collection is None or self.ax is None or rows.size == 0:
+            return []
+        spec = self.spec
+        classes = classify(self.values()[rows], spec.bins, spec.exact_values, spec.mode)
+        colors = classes_to_rgba(classes, spec.class_colors(), spec.no_data_color)
+        self.facecolors[rows] = colors
+        self.collection.set_facecolor(self.facecolors[self.rows])
+
+        ax = self.ax
+        renderer = ax.figure.canvas.get_renderer()
+        bboxes = []
+        pad = max(spec.edge_width, spec.outer_edge_width) * 2 + 2
+        for row, color in zip(rows, colors):
+            if spec.shared_borders:
+                patch = PathPatch(self.paths[row], facecolor=color, edgecolor="none", linewidth=0, transform=ax.transData)
+            else:
+                patch = PathPatch(
+                    self.paths[row],
+                    facecolor=color,
+                    edgecolor=spec.edge_color,
+                    linewidth=spec.edge_width,
+                    transform=ax.transData,
+                )
+            patch.axes = ax
+            patch.set_clip_path(ax.patch)
+            ax.draw_artist(patch)
+            # Заливка перекрыла внутреннюю половину границ региона — дорисовываем их
+            # только внутри региона, чтобы не накладывать сглаживание дважды у соседей
+            for lines in self.borders:
+                lines.set_clip_path(self.paths[row], ax.transData)
+                ax.draw_artist(lines)
+                lines.set_clip_path(ax.patch)
+            bboxes.append(patch.get_window_extent(renderer).padded(pad))
+        return bboxes
+
+    def set_view(self, xmin: float, ymin: float, xmax: float, ymax: float, pixel_size: float):
+        # Во время навигации оставляем только попавшие в окно регионы (отбор по R-дереву)
+        # с контурами, упрощёнными до размера пикселя текущего уровня масштаба; общие границы — так же
+        if self.collection is None:
+            return
+        level = ViewportIndex.level_for(pixel_size)
+        self._set_visible(self.viewport.visible(xmin, ymin, xmax, ymax), level)
+        self.viewport.prefetch(self.rows, (level - 1, level + 1))
+        if not self.borders:
+            return
+        self.border_rows = [index.visible(xmin, ymin, xmax, ymax) for index in self.arc_indexes]
+        for lines, index, rows in zip(self.borders, self.arc_indexes, self.border_rows):
+            lines.set_segments(index.segments(rows, level))
+            index.prefetch(rows, (level - 1, level + 1))
+
+    def restore_full_detail(self):
+        if self.collection is None:
+            return
+        self._set_visible(self.rows, None)
+        for lines, index, rows in zip(self.borders, self.arc_indexes, self.border_rows):
+            lines.set_segments(index.segments(rows))
+
+    def _set_visible(self, rows: np.ndarray, level: Optional[int]):
+        self.rows = rows
+        self.collection.set_paths(self.viewport.paths(rows, level))
+        self.collection.set_facecolor(self.facecolors[rows])
+
+
+def encode_indexed_png(target, index: np.ndarray, palette: np.ndarray, dpi: int = 300, compress_level: int = 6):
+    image = Image.fromarray(index, mode="P")
+    image.putpalette(palette[:, :3].ravel().tolist())
+    if (palette[:, 3] < 255).any():
+        image.info["transparency"] = palette[:, 3].tobytes()
+    image.save(target, format="PNG", compress_level=compress_level, dpi=(dpi, dpi))
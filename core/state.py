@@ -0,0 +1,67 @@
+from collections import Counter
+from typing import Any, Callable, Hashable, Iterable, Tuple
+
+# Входы карты. Каждое действие пользователя увеличивает версию тех входов, которые оно меняет.
+INPUTS = ("layer", "key", "values", "scheme", "style", "legend")
+
+# Производные продукты и входы, от которых они зависят
+SCHEME_TABLES = ("scheme",)                               # схема, считанная из таблиц интервалов
+CLASSIFICATION = ("layer", "values", "scheme")            # индексы классов
+STATS = CLASSIFICATION                                    # статистика классов для легенды
+COLORS = ("layer", "values", "scheme", "style")           # цвета заливки (цвет «нет данных» — в стиле)
+ARTISTS = ("layer", "style")                              # коллекции matplotlib на холсте
+TABLE = ("layer", "key", "values")                        # таблица «регион — значение»
+LEGEND = ("layer", "values", "scheme", "style", "legend") # легенда на холсте
+
+
+class MapState:
+    # Версионированные входы и запомненные производные продукты. Продукт помнит версии
+    # входов, из которых он получен, и пересчитывается, только если хотя бы одна из них
+    # изменилась. Счётчики показывают, сколько раз каждый продукт реально пересчитывался.
+    def __init__(self):
+        self.versions: dict[str, int] = dict.fromkeys(INPUTS, 0)
+        self.counters: Counter[str] = Counter()
+        self._values: dict[str, Hashable] = {}
+        self._stamps: dict[str, Tuple[int, ...]] = {}
+        self._products: dict[str, Any] = {}
+
+    def touch(self, *inputs: str):
+        for name in inputs:
+            self.versions[name] += 1
+
+    def set(self, name: str, value: Hashable, input_name: str = None) -> bool:
+        # Меняет версию входа, только если значение действительно другое
+        if name in self._values and self._values[name] == value:
+            return False
+        self._values[name] = value
+        self.touch(input_name or name)
+        return True
+
+    def _stamp_for(self, inputs: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self.versions[name] for name in inputs)
+
+    def is_current(self, product: str, inputs: Iterable[str]) -> bool:
+        return self._stamps.get(product) == self._stamp_for(inputs)
+
+    def record(self, product: str, inputs: Iterable[str]):
+        # Продукт только что пересчитан из текущих версий входов
+        self._stamps[product] = self._stamp_for(inputs)
+        self.counters[product] += 1
+
+    def stamp(self, product: str, inputs: Iterable[str]):
+        # Продукт обновлён на месте (без пересчёта) и соответствует текущим версиям
+        self._stamps[product] = self._stamp_for(inputs)
+
+    def memo(self, product: str, inputs: Iterable[str], compute: Callable[[], Any]) -> Any:
+        inputs = tuple(inputs)
+        if product in self._products and self.is_current(product, inputs):
+            return self._products[product]
+        value = compute()
+        self._products[product] = value
+        self.record(product, inputs)
+        return value
+
+    def invalidate(self, *products: str):
+        for product in products:
+            self._stamps.pop(product, None)
+            self._products.pop(product, None)
@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List
+import hashlib
+
+import numpy as np
+import shapely
+
+_CACHE_SIZE = 8
+_cache: OrderedDict[str, "Topology"] = OrderedDict()
+
+
+@dataclass
+class Topology:
+    internal: List[np.ndarray]  # общие границы соседних регионов, каждая — один раз
+    external: List[np.ndarray]  # внешний контур слоя (граница без соседа)
+
+
+def _merge(segments: np.ndarray) -> List[np.ndarray]:
+    # Склеиваем отрезки в непрерывные дуги, чтобы в SVG получались длинные пути, а не тысячи отрезков
+    if len(segments) == 0:
+        return []
+    merged = shapely.line_merge(shapely.multilinestrings(shapely.linestrings(segments)))
+    coords, index = shapely.get_coordinates(shapely.get_parts(merged), return_index=True)
+    bounds = np.flatnonzero(np.r_[True, index[1:] != index[:-1], True])
+    return [coords[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+
+def build_topology(geoms) -> Topology:
+    # Разбиваем все кольца на отрезки и находим совпадающие: отрезок, встречающийся
+    # в двух кольцах, — общая граница соседей, встречающийся один раз — внешняя.
+    # Координаты сравниваются после привязки к сетке, чтобы не зависеть от шума в последних битах.
+    geoms = np.asarray(geoms, dtype=object)
+    rings = shapely.get_rings(shapely.get_parts(geoms))
+    coords, ring_idx = shapely.get_coordinates(rings, return_index=True)
+
+    key = hashlib.sha1(coords.tobytes() + ring_idx.tobytes()).hexdigest()
+    cached = _cache.get(key)
+    if cached is not None:
+        _cache.move_to_end(key)
+        return cached
+
+    same_ring = ring_idx[1:] == ring_idx[:-1]
+    a, b = coords[:-1][same_ring], coords[1:][same_ring]
+    keep = np.any(a != b, axis=1)
+    a, b = a[keep], b[keep]
+
+    extent = np.ptp(coords, axis=0).max() if len(coords) else 1.0
+    grid = (extent or 1.0) * 1e-9
+    qa, qb = np.round(a / grid).astype("int64"), np.round(b / grid).astype("int64")
+    swap = (qa[:, 0] > qb[:, 0]) | ((qa[:, 0] == qb[:, 0]) & (qa[:, 1] > qb[:, 1]))
+    lo = np.where(swap[:, None], qb, qa)
+    hi = np.where(swap[:, None], qa, qb)
+    _, first, counts = np.unique(np.hstack([lo, hi]), axis=0, return_index=True, return_counts=True)
+
+    segments = np.stack([a[first], b[first]], axis=1)
+    topology = Topology(
+        internal=_merge(segments[counts > 1]),
+        external=_merge(segments[counts == 1]),
+    )
+    _cache[key] = topology
+    while len(_cache) > _CACHE_SIZE:
+        _cache.popitem(last=False)
+    return topology
@@ -0,0 +1,130 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+import math
+import threading
+
+import numpy as np
+import shapely
+from matplotlib.path import Path
+
+from core.paths import geometry_paths
+
+# Уровни детализации: уровень L соответствует допуску упрощения 2**L единиц проекции
+MIN_LEVEL = -8
+MAX_LEVEL = 24
+# Сколько уровней держать в памяти: текущий, соседние и несколько недавних
+MAX_CACHED_LEVELS = 6
+
+
+class _LevelCache(ABC):
+    # Кэш упрощённых по уровням детализации геометрий с фоновой подготовкой соседних уровней.
+    # Упрощаются только запрошенные строки (попавшие в окно), и результат запоминается по строкам:
+    # навигация не ждёт упрощения всего слоя. Упрощение идёт без блокировки — поток окна
+    # и фоновый поток могут посчитать одну строку дважды, но не ждут друг друга.
+    def __init__(self, size: int):
+        self.size = size
+        # Уровень -> (элементы по строкам, признак готовности); порядок — порядок использования
+        self._levels: OrderedDict[int, tuple[np.ndarray, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: List[Future] = []
+
+    @abstractmethod
+    def _build(self, rows: np.ndarray, level: int) -> list:
+        # Упрощённые до допуска 2**level элементы строк rows в порядке rows
+        ...
+
+    def _entry(self, level: int) -> tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            entry = self._levels.get(level)
+            if entry is None:
+                entry = (np.empty(self.size, dtype=object), np.zeros(self.size, dtype=bool))
+                self._levels[level] = entry
+                while len(self._levels) > MAX_CACHED_LEVELS:
+                    self._levels.popitem(last=False)
+            else:
+                self._levels.move_to_end(level)
+            return entry
+
+    def get(self, rows: np.ndarray, level: int) -> list:
+        items, ready = self._entry(level)
+        missing = rows[~ready[rows]]
+        if missing.size:
+            built = self._build(missing, level)
+            with self._lock:
+                for row, item in zip(missing, built):
+                    items[row] = item
+                ready[missing] = True
+        return [items[i] for i in rows]
+
+    def prefetch(self, rows: np.ndarray, levels):
+        # Готовим упрощённые контуры тех же строк на соседних уровнях в фоне, чтобы первое
+        # приближение или отдаление не ждало упрощения. Устаревшие заявки (окно уже сдвинулось) снимаются.
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="viewport-lod")
+        for future in self._pending:
+            future.cancel()
+        self._pending = [self._executor.submit(self.get, rows, level) for level in levels]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class ViewportIndex(_LevelCache):
+    def __init__(self, geoms, full_paths: List[Path]):
+        self.geoms = np.asarray(geoms, dtype=object)
+        super().__init__(len(self.geoms))
+        self.full_paths = full_paths
+        self.tree = shapely.STRtree(self.geoms)
+
+    def visible(self, xmin: float, ymin: float, xmax: float, ymax: float) -> np.ndarray:
+        return np.sort(self.tree.query(shapely.box(xmin, ymin, xmax, ymax)))
+
+    @staticmethod
+    def level_for(pixel_size: float) -> int:
+        if not pixel_size > 0 or math.isinf(pixel_size):
+            return MIN_LEVEL
+        return min(max(int(math.floor(math.log2(pixel_size))), MIN_LEVEL), MAX_LEVEL)
+
+    def paths(self, rows: np.ndarray, level: Optional[int] = None) -> List[Path]:
+        # level=None — полная детализация, иначе упрощённые до размера пикселя контуры
+        if level is None:
+            return [self.full_paths[i] for i in rows]
+        return self.get(rows, level)
+
+    def _build(self, rows: np.ndarray, level: int) -> List[Path]:
+        simplified = shapely.simplify(self.geoms[rows], 2.0 ** level, preserve_topology=True)
+        return geometry_paths(simplified)
+
+
+class ArcIndex(_LevelCache):
+    # То же для дуг границ из топологии слоя: отбор по окну и упрощение до размера пикселя,
+    # чтобы общие границы при навигации не рисовались целиком в полной детализации
+    def __init__(self, arcs: List[np.ndarray]):
+        super().__init__(len(arcs))
+        self.arcs = arcs
+        if arcs:
+            coords = np.concatenate(arcs)
+            index = np.repeat(np.arange(len(arcs)), [len(a) for a in arcs])
+            self.lines = shapely.linestrings(coords, indices=index)
+        else:
+            self.lines = np.empty(0, dtype=object)
+        self.tree = shapely.STRtree(self.lines)
+
+    def visible(self, xmin: float, ymin: float, xmax: float, ymax: float) -> np.ndarray:
+        return np.sort(self.tree.query(shapely.box(xmin, ymin, xmax, ymax)))
+
+    def segments(self, rows: np.ndarray, level: Optional[int] = None) -> List[np.ndarray]:
+        if level is None:
+            return [self.arcs[i] for i in rows]
+        return self.get(rows, level)
+
+    def _build(self, rows: np.ndarray, level: int) -> List[np.ndarray]:
+        simplified = shapely.simplify(self.lines[rows], 2.0 ** level, preserve_topology=False)
+        coords, index = shapely.get_coordinates(simplified, return_index=True)
+        bounds = np.searchsorted(index, np.arange(len(rows) + 1))
+        return [coords[bounds[i]:bounds[i + 1]] for i in range(len(rows))]
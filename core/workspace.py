@@ -0,0 +1,156 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+import uuid
+
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from core.cache import LayerCache
+
+DEFAULT_MEMORY_BUDGET = 1024 * 2**20
+
+
+def memory_usage_by_column(gdf: gpd.GeoDataFrame) -> dict[str, int]:
+    usage = {}
+    for col, nbytes in gdf.memory_usage(index=True, deep=True).items():
+        usage[str(col)] = int(nbytes)
+    # memory_usage учитывает только указатели на геометрии; добавляем координаты GEOS
+    geom_col = gdf.geometry.name
+    coords = int(shapely.get_num_coordinates(gdf.geometry.values).sum())
+    usage[geom_col] = usage.get(geom_col, 0) + coords * 16
+    return usage
+
+
+@dataclass
+class Layer:
+    name: str
+    path: str
+    gdf: Optional[gpd.GeoDataFrame]
+    key_geo: Optional[str] = None
+    nbytes: int = 0
+    token: str = ""
+    spilled: bool = False
+
+
+class Workspace:
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET, cache: Optional[LayerCache] = None):
+        self.memory_budget = memory_budget
+        self.cache = cache or LayerCache()
+        # Порядок OrderedDict — порядок использования: последний элемент самый свежий
+        self.layers: OrderedDict[str, Layer] = OrderedDict()
+        self.datasets: dict[str, pd.DataFrame] = {}
+        self.active_layer: Optional[str] = None
+        self.active_dataset: Optional[str] = None
+
+    def _unique_name(self, names, base: str) -> str:
+        name, n = base, 2
+        while name in names:
+            name = f"{base} ({n})"
+            n += 1
+        return name
+
+    def add_layer(self, path: str, gdf: gpd.GeoDataFrame, key_geo: Optional[str]) -> Layer:
+        # Повторное открытие того же файла заменяет слой, а не плодит копии
+        for layer in self.layers.values():
+            if layer.path == path:
+                self._drop_spilled(layer)
+                layer.gdf, layer.key_geo, layer.spilled = gdf, key_geo, False
+                layer.nbytes = sum(memory_usage_by_column(gdf).values())
+                self.activate(layer.name)
+                return layer
+
+        name = self._unique_name(self.layers, Path(path).stem)
+        layer = Layer(name, path, gdf, key_geo, token=uuid.uuid4().hex)
+        layer.nbytes = sum(memory_usage_by_column(gdf).values())
+        self.layers[name] = layer
+        self.activate(name)
+        return layer
+
+    def activate(self, name: str) -> Layer:
+        if name not in self.layers:
+            raise ValueError(f"Слой «{name}» не найден в рабочем пространстве.")
+        layer = self.layers[name]
+        if layer.spilled:
+            try:
+                layer.gdf = self.cache.restore(layer.token)
+            except Exception as e:
+                raise ValueError(f"Не удалось восстановить слой «{name}» из кэша:\n{e}")
+            layer.spilled = False
+        self.layers.move_to_end(name)
+        self.active_layer = name
+        self._enforce_budget()
+        return layer
+
+    def update_layer(self, name: str, gdf: gpd.GeoDataFrame, key_geo: Optional[str]):
+        layer = self.layers.get(name)
+        if layer is None:
+            return
+        layer.gdf, layer.key_geo = gdf, key_geo
+        layer.nbytes = sum(memory_usage_by_column(gdf).values())
+        self._enforce_budget()
+
+    def remove_layer(self, name: str):
+        layer = self.layers.pop(name, None)
+        if layer is None:
+            return
+        self._drop_spilled(layer)
+        if self.active_layer == name:
+            self.active_layer = None
+
+    def close(self):
+        # Выгруженные слои удаляются с диска вместе с каталогом запуска
+        for name in [name for name, layer in self.layers.items() if layer.spilled]:
+            self.remove_layer(name)
+        self.cache.close()
+
+    def _drop_spilled(self, layer: Layer):
+        if layer.spilled:
+            self.cache.discard(layer.token)
+            layer.spilled = False
+
+    def add_dataset(self, path: str, df: pd.DataFrame) -> str:
+        # Повторно открытый CSV с тем же именем заменяет прежний набор
+        name = Path(path).stem
+        self.datasets[name] = df
+        self.active_dataset = name
+        return name
+
+    def activate_dataset(self, name: str) -> pd.DataFrame:
+        if name not in self.datasets:
+            raise ValueError(f"Набор данных «{name}» не найден в рабочем пространстве.")
+        self.active_dataset = name
+        return self.datasets[name]
+
+    def get_layer_names(self) -> list[str]:
+        return list(self.layers)
+
+    def get_dataset_names(self) -> list[str]:
+        return list(self.datasets)
+
+    def is_in_memory(self, name: str) -> bool:
+        layer = self.layers.get(name)
+        return layer is not None and not layer.spilled
+
+    def memory_in_use(self) -> int:
+        total = sum(layer.nbytes for layer in self.layers.values() if not layer.spilled)
+        total += sum(int(df.memory_usage(index=True, deep=True).sum()) for df in self.datasets.values())
+        return total
+
+    def _enforce_budget(self):
+        # Выгружаем наименее давно использованные неактивные слои, пока не уложимся в бюджет
+        for name in list(self.layers):
+            if self.memory_in_use() <= self.memory_budget:
+                break
+            layer = self.layers[name]
+            if name == self.active_layer or layer.spilled:
+                continue
+            try:
+                self.cache.spill(layer.token, layer.gdf)
+            except Exception as e:
+                print(f"Предупреждение: Не удалось выгрузить слой «{name}» на диск:\n{e}")
+                continue
+            layer.gdf = None
+            layer.spilled = True
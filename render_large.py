@@ -0,0 +1,44 @@
+import argparse
+import json
+
+from core.models import MapSpec
+from core.partitioned import DEFAULT_MEMORY_LIMIT, PartitionedLayer, PartitionedRenderer, ValueTable
+
+
+# Отрисовка слоёв, которые не помещаются в память: слой читается частями,
+# значения CSV присоединяются к каждой части по ключу региона.
+def main():
+    parser = argparse.ArgumentParser(description="Отрисовка хороплета для слоя больше оперативной памяти")
+    parser.add_argument("layer", help="путь к геоданным (GeoPackage, Shapefile, GeoJSON)")
+    parser.add_argument("values", help="CSV с показателями")
+    parser.add_argument("--key-geo", required=True, help="поле региона в слое")
+    parser.add_argument("--key-csv", required=True, help="поле региона в CSV")
+    parser.add_argument("--value", required=True, help="поле значения в CSV")
+    parser.add_argument("--scheme", required=True, help="файл схемы JSON")
+    parser.add_argument("-o", "--output", required=True, help="выходной файл (.png, .svg, .pdf)")
+    parser.add_argument("--where", help="SQL-фильтр по атрибутам слоя")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        default=DEFAULT_MEMORY_LIMIT // 2**20,
+        help="память на части слоя, МБ (холст добавляет ширина × высота × 4 байта)",
+    )
+    args = parser.parse_args()
+
+    with open(args.scheme, "r", encoding="utf-8") as f:
+        spec = MapSpec.from_dict(json.load(f))
+    fmt = args.output.rsplit(".", 1)[-1].lower()
+
+    # Значения CSV лежат на диске рядом с частями слоя; каждая часть берёт только свои ключи
+    with ValueTable(args.values, args.key_csv, args.value) as values:
+        with PartitionedLayer(args.layer, args.key_geo, where=args.where, memory_limit=args.memory_limit * 2**20) as layer:
+            PartitionedRenderer(layer, values).save(args.output, spec, fmt=fmt, dpi=args.dpi)
+    print(f"Карта сохранена в {args.output} (объектов: {layer.count}, частей: {layer.num_partitions})")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except ValueError as e:
+        raise SystemExit(str(e))
@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from core.data_handler import DataHandler
+from core.models import MapSpec
+from core.renderer import Renderer
+
+CONTENT_TYPES = {"png": "image/png", "png8": "image/png", "svg": "image/svg+xml"}
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+MAX_BODY = 64 * 2**20
+# Пределы размера результата: холст Agg занимает ширина × высота × 4 байта в рабочем процессе
+MAX_DPI = 600
+MAX_FIGSIZE = 20.0               # дюймов по каждой стороне
+MAX_PIXELS = 25_000_000          # ~100 МБ буфера RGBA
+
+# ---------------------- Рабочие процессы ----------------------
+# Каждый процесс пула один раз загружает слои и строит пути matplotlib,
+# после чего обслуживает запросы на «тёплых» данных.
+_renderers: dict[str, Renderer] = {}
+
+
+def _init_worker(layers: dict[str, tuple[str, Optional[str]]]):
+    for name, (path, key) in layers.items():
+        dh = DataHandler()
+        dh.load_geojson(path)
+        key = key or dh.get_key_geo()
+        gdf = dh.get_gdf()
+        gdf[key] = gdf[key].astype(str).str.strip()
+        renderer = Renderer(gdf, dh.get_value_column_name(), key)
+        renderer.paths  # пути строятся лениво — строим их до первого запроса
+        _renderers[name] = renderer
+
+
+def _render(layer: str, values: dict, scheme: dict, fmt: str, dpi: int, figsize: tuple[float, float]) -> bytes:
+    renderer = _renderers[layer]
+    gdf = renderer.gdf
+    clean = {str(k).strip(): v for k, v in values.items()}
+    gdf[renderer.value_col] = gdf[renderer.key_col].map(clean).astype("float64")
+    return renderer.to_bytes(MapSpec.from_dict(scheme), fmt, dpi=dpi, figsize=figsize)
+
+
+# ---------------------- Сервер ----------------------
+class RenderService:
+    def __init__(self, layers: dict[str, tuple[str, Optional[str]]], workers: int, cache_size: int):
+        self.layers = layers
+        self.workers = workers
+        self.pool = self._new_pool()
+        self.cache: OrderedDict[str, bytes] = OrderedDict()
+        self.cache_size = cache_size
+        # Одинаковые запросы, пришедшие одновременно, ждут один и тот же результат
+        self.inflight: dict[str, asyncio.Future] = {}
+        self.latencies: deque[float] = deque(maxlen=1000)
+        self.stats = {"requests": 0, "renders": 0, "cache_hits": 0, "coalesced": 0, "errors": 0, "pool_restarts": 0}
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.layers,))
+
+    def _restart_pool(self, broken: ProcessPoolExecutor):
+        # Рабочий процесс завершился аварийно (нехватка памяти, сигнал) — такой пул больше
+        # не принимает задач, поэтому заменяем его новым. Одновременные запросы, получившие
+        # ту же ошибку, пул повторно не пересоздают.
+        if self.pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.pool = self._new_pool()
+            self.stats["pool_restarts"] += 1
+
+    async def warm_up(self):
+        # Прогреваем все процессы, чтобы первый запрос не ждал загрузки слоёв
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, time.sleep, 0.1) for _ in range(self.workers)))
+
+    def _parse(self, body: bytes) -> tuple[str, tuple]:
+        try:
+            req = json.loads(body or b"{}")
+        except ValueError as e:
+            raise ValueError(f"Некорректный JSON: {e}")
+        layer = req.get("layer") or next(iter(self.layers))
+        if layer not in self.layers:
+            raise KeyError(f"Слой «{layer}» не загружен.")
+        fmt = str(req.get("format", "png")).lower()
+        if fmt not in CONTENT_TYPES:
+            raise ValueError(f"Неподдерживаемый формат: {fmt}")
+        values = req.get("values") or {}
+        if not isinstance(values, dict):
+            raise ValueError("Поле values должно быть объектом «регион: значение».")
+        scheme = req.get("scheme") or {}
+        try:
+            MapSpec.from_dict(scheme)
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Некорректная схема: {e}")
+        dpi, figsize = self._parse_size(req)
+        args = (layer, values, scheme, fmt, dpi, figsize)
+        digest = hashlib.sha256(json.dumps(args, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        return digest, args
+
+    @staticmethod
+    def _parse_size(req: dict) -> tuple[int, tuple[float, float]]:
+        dpi = int(req.get("dpi", 150))
+        if not 1 <= dpi <= MAX_DPI:
+            raise ValueError(f"dpi должно быть от 1 до {MAX_DPI}.")
+        figsize = tuple(float(v) for v in req.get("figsize", (6, 6)))
+        if len(figsize) != 2 or not all(0 < v <= MAX_FIGSIZE for v in figsize):
+            raise ValueError(f"figsize — два размера в дюймах от 0 до {MAX_FIGSIZE:g}.")
+        if figsize[0] * figsize[1] * dpi**2 > MAX_PIXELS:
+            raise ValueError(f"Изображение больше {MAX_PIXELS:,} пикселей — уменьшите dpi или figsize.")
+        return dpi, figsize
+
+    async def render(self, body: bytes) -> tuple[bytes, str]:
+        started = time.perf_counter()
+        self.stats["requests"] += 1
+        digest, args = self._parse(body)
+        content_type = CONTENT_TYPES[args[3]]
+
+        if digest in self.cache:
+            self.cache.move_to_end(digest)
+            self.stats["cache_hits"] += 1
+            self.latencies.append(time.perf_counter() - started)
+            return self.cache[digest], content_type
+
+        future = self.inflight.get(digest)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            data = await asyncio.shield(future)
+        else:
+            loop = asyncio.get_running_loop()
+            pool = self.pool
+            try:
+                future = loop.run_in_executor(pool, _render, *args)
+            except BrokenProcessPool:
+                self._restart_pool(pool)
+                raise
+            self.inflight[digest] = future
+            try:
+                data = await future
+            except BrokenProcessPool:
+                self._restart_pool(pool)
+                raise
+            finally:
+                del self.inflight[digest]
+            self.stats["renders"] += 1
+            self.cache[digest] = data
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        self.latencies.append(time.perf_counter() - started)
+        return data, content_type
+
+    def metrics(self) -> dict:
+        lat = sorted(self.latencies)
+
+        def pct(p):
+            return round(lat[min(int(p * len(lat)), len(lat) - 1)] * 1000, 2) if lat else None
+
+        return {
+            **self.stats,
+            "queue_depth": len(self.inflight),
+            "workers": self.workers,
+            "cached_results": len(self.cache),
+            "latency_ms": {"p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99)},
+            "layers": list(self.layers),
+        }
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status, payload, content_type = await self._dispatch(reader)
+        except Exception as e:
+            self.stats["errors"] += 1
+            status, payload, content_type = 500, json.dumps({"error": str(e)}, ensure_ascii=False).encode("utf-8"), "application/json"
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        try:
+            writer.write(head.encode("latin-1") + payload)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _dispatch(self, reader: asyncio.StreamReader) -> tuple[int, bytes, str]:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) < 2:
+            return 400, b"", "text/plain"
+        method, target = request_line[0].upper(), request_line[1].split("?", 1)[0]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = headers.get("content-length", "0")
+        if not (length.isascii() and length.isdigit()):
+            return 400, b'{"error": "invalid Content-Length"}', "application/json"
+        length = int(length)
+        if length > MAX_BODY:
+            return 400, b'{"error": "request too large"}', "application/json"
+        try:
+            body = await reader.readexactly(length) if length else b""
+        except asyncio.IncompleteReadError:
+            return 400, b'{"error": "request body shorter than Content-Length"}', "application/json"
+
+        if target == "/metrics":
+            return 200, json.dumps(self.metrics()).encode("utf-8"), "application/json"
+        if target == "/health":
+            return 200, b'{"status": "ok"}', "application/json"
+        if target != "/render":
+            return 404, b"", "text/plain"
+        if method != "POST":
+            return 405, b"", "text/plain"
+        try:
+            data, content_type = await self.render(body)
+        except KeyError as e:
+            self.stats["errors"] += 1
+            return 404, json.dumps({"error": e.args[0]}, ensure_ascii=False).encode("utf-8"), "application/json"
+        except (ValueError, TypeError) as e:
+            self.stats["errors"] += 1
+            return 400, json.dumps({"error": str(e)}, ensure_ascii=False).encode("utf-8"), "application/json"
+        return 200, data, content_type
+
+
+def parse_layers(layer_specs: list[str], key_specs: list[str]) -> dict[str, tuple[str, Optional[str]]]:
+    # --layer имя=путь, --key имя=поле_региона (по умолчанию — первое поле слоя)
+    keys = dict(spec.partition("=")[::2] for spec in key_specs)
+    layers = {}
+    for spec in layer_specs:
+        name, sep, path = spec.partition("=")
+        if not sep:
+            raise SystemExit(f"Некорректное описание слоя: {spec} (ожидается имя=путь)")
+        layers[name] = (path, keys.get(name))
+    return layers
+
+
+async def serve(args):
+    service = RenderService(parse_layers(args.layer, args.key), args.workers, args.cache_size)
+    await service.warm_up()
+    server = await asyncio.start_server(service.handle, args.host, args.port)
+    print(f"Сервис отрисовки запущен на http://{args.host}:{args.port} (процессов: {args.workers})")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP-сервис отрисовки хороплетов")
+    parser.add_argument("--layer", action="append", required=True, help="имя=путь к геоданным, можно повторять")
+    parser.add_argument("--key", action="append", default=[], help="имя=поле региона для слоя")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--cache-size", type=int, default=256, help="число закэшированных результатов")
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
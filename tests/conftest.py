@@ -0,0 +1,83 @@
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pytest
+import shapely
+
+# GUI-тесты работают без дисплея
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+GRID = 8
+BINS = ((0, 30, "#ff0000"), (30, 60, "#00ff00"), (60, 100, "#0000ff"))
+
+
+@pytest.fixture
+def layer_files(tmp_path):
+    # Сетка GRID x GRID с двумя полями-ключами и CSV значений по полю name
+    cells = [shapely.box(30 + i, 50 + j, 31 + i, 51 + j) for i in range(GRID) for j in range(GRID)]
+    names = [f"R{i}" for i in range(len(cells))]
+    gdf = gpd.GeoDataFrame(
+        {"name": names, "code": [f"C{i:03d}" for i in range(len(cells))]},
+        geometry=cells,
+        crs="EPSG:4326",
+    )
+    geo = tmp_path / "grid.geojson"
+    gdf.to_file(geo, driver="GeoJSON")
+    values = np.random.default_rng(0).integers(0, 100, len(cells)).astype(float)
+    values[::9] = np.nan
+    csv = tmp_path / "values.csv"
+    pd.DataFrame({"region": names, "value": values}).to_csv(csv, index=False)
+    return geo, csv
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    from PyQt6.QtWidgets import QApplication
+
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def messages(monkeypatch):
+    # Окна сообщений модальные — в тестах складываем их в список
+    from ui.main_window import UIMainWindow
+
+    sink = []
+    for name in ("show_error_message", "show_warning_message", "show_info_message"):
+        monkeypatch.setattr(UIMainWindow, name, lambda self, title, text, name=name: sink.append((name, title, text)))
+    return sink
+
+
+@pytest.fixture
+def choropleth_app(qapp, messages, layer_files, monkeypatch):
+    # Приложение с загруженной сеткой, присоединёнными значениями, тремя интервалами и построенной картой
+    import app as app_module
+    from PyQt6.QtWidgets import QTableWidgetItem
+
+    geo, csv = layer_files
+    monkeypatch.setattr(app_module, "DEFAULT_GEOJSON_PATH", str(geo))
+    window = app_module.ChoroplethApp()
+    ui = window.ui
+
+    monkeypatch.setattr(ui, "get_file_dialog_open_file_name", lambda *args: str(csv))
+    window.on_open_csv()
+    ui.cmb_geo_key.setCurrentText("name")
+    ui.cmb_csv_key.setCurrentText("region")
+    ui.cmb_csv_val.setCurrentText("value")
+    window.on_join()
+    for lower, upper, color in BINS:
+        r = ui.get_bin_table_row_count()
+        ui.insert_bin_table_row(r)
+        ui.set_bin_table_item(r, 0, QTableWidgetItem(str(lower)))
+        ui.set_bin_table_item(r, 1, QTableWidgetItem(str(upper)))
+        ui.set_bin_table_item(r, 2, QTableWidgetItem(color))
+    window.on_plot()
+    yield window
+    window.close()
+    if window.renderer is not None:
+        window.renderer.close()
@@ -0,0 +1,117 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+from PyQt6.QtCore import QCoreApplication
+
+import app as app_module
+from core.models import Bin, MapSpec
+from core.renderer import Renderer
+from utils import export_queue
+from utils.export_queue import ExportQueue
+from utils.render_regression import BINS, grid_layer
+
+
+def _wait(predicate, timeout: float = 60.0):
+    started = time.monotonic()
+    while not predicate():
+        assert time.monotonic() - started < timeout, "экспорт не завершился вовремя"
+        QCoreApplication.processEvents()
+        time.sleep(0.02)
+    QCoreApplication.processEvents()
+
+
+def test_queue_writes_formats_and_forgets_finished_jobs(tmp_path):
+    renderer = Renderer(grid_layer(6), "__value__", "name")
+    queue = ExportQueue(workers=2)
+    try:
+        targets = [(fmt, str(tmp_path / f"map.{ext}")) for fmt, ext in (("png", "png"), ("svg", "svg"), ("png8", "p.png"))]
+        jobs = queue.submit(renderer, BINS, targets, dpi=50)
+        _wait(lambda: all(job.finished for job in jobs))
+        assert [job.status for job in jobs] == ["done"] * 3
+        assert all((tmp_path / name).stat().st_size > 0 for name in ("map.png", "map.svg", "map.p.png"))
+        assert not list(tmp_path.glob("*.tmp"))
+
+        (job,) = queue.submit(renderer, BINS, [("pdf", str(tmp_path / "map.pdf"))], dpi=50)
+        assert queue.jobs == [job]
+        _wait(lambda: job.finished)
+    finally:
+        queue.shutdown(wait=True)
+
+
+def test_app_export_list_is_bounded(choropleth_app, tmp_path, monkeypatch):
+    window = choropleth_app
+    monkeypatch.setattr(app_module, "EXPORT_HISTORY", 3)
+    for i, fmt in enumerate(("png", "svg", "png8", "svg")):
+        monkeypatch.setattr(window.ui, "get_file_dialog_save_file_name", lambda *args, i=i: str(tmp_path / f"map{i}"))
+        window._save_single(fmt, "Сохранить", "")
+    _wait(lambda: not window._export_items)
+    assert window.ui.lst_exports.count() == 3
+    assert not window._export_notify
+
+
+def test_window_canvas_draws_while_export_renders(choropleth_app, tmp_path, monkeypatch):
+    # Экспорт останавливается посреди savefig своей фигуры; холст окна при этом рисуется без ожидания
+    rendering, release = threading.Event(), threading.Event()
+    original = export_queue._CaptureCanvas.print_capture
+
+    def blocked(self, sink, **kwargs):
+        rendering.set()
+        release.wait(10)
+        original(self, sink, **kwargs)
+
+    monkeypatch.setattr(export_queue._CaptureCanvas, "print_capture", blocked)
+    window = choropleth_app
+    (job,) = window.export_queue.submit(window.renderer, window.spec, [("png", str(tmp_path / "map.png"))], dpi=50)
+    try:
+        assert rendering.wait(10)
+        started = time.monotonic()
+        window.ui.get_figure_canvas().draw()
+        assert time.monotonic() - started < 5
+        assert job.status == "rendering"
+    finally:
+        release.set()
+    _wait(lambda: job.finished)
+    assert job.status == "done"
+
+
+def test_export_uses_values_from_submit_time(tmp_path):
+    renderer = Renderer(grid_layer(6), "__value__", "name")
+    reference = Renderer(grid_layer(6), "__value__", "name")
+    queue = ExportQueue(workers=1)
+    try:
+        # Пул занят, пока значения слоя правятся после постановки экспорта в очередь
+        busy = threading.Event()
+        queue.submit_task(str(tmp_path / "busy"), "tiles", lambda report: busy.wait(10))
+        targets = [("png", str(tmp_path / "map.png")), ("png8", str(tmp_path / "map8.png"))]
+        jobs = queue.submit(renderer, BINS, targets, dpi=30)
+        renderer.gdf["__value__"] = float("nan")
+        busy.set()
+        expected = queue.submit(reference, BINS, [("png", str(tmp_path / "ref.png")), ("png8", str(tmp_path / "ref8.png"))], dpi=30)
+        _wait(lambda: all(job.finished for job in jobs + expected))
+    finally:
+        queue.shutdown(wait=True)
+    for name, ref in (("map.png", "ref.png"), ("map8.png", "ref8.png")):
+        assert np.array_equal(_pixels(tmp_path / name), _pixels(tmp_path / ref))
+
+
+def _pixels(path) -> np.ndarray:
+    return np.asarray(Image.open(path).convert("RGBA"))
+
+
+def test_png8_refuses_schemes_beyond_256_colors(tmp_path):
+    renderer = Renderer(grid_layer(6), "__value__", "name")
+    spec = MapSpec(bins=[Bin(i, i + 1, f"#{i:06x}") for i in range(300)])
+    with pytest.raises(ValueError, match="не больше 256 цветов"):
+        renderer.indexed(spec, dpi=20)
+
+    queue = ExportQueue(workers=1)
+    try:
+        (job,) = queue.submit(renderer, spec, [("png8", str(tmp_path / "map.png"))], dpi=20)
+        _wait(lambda: job.finished)
+        assert job.status == "failed" and "256" in job.error
+        assert not (tmp_path / "map.png").exists()
+    finally:
+        queue.shutdown(wait=True)
@@ -0,0 +1,9 @@
+def test_outer_border_controls_follow_shared_borders(choropleth_app):
+    ui = choropleth_app.ui
+    ui.chk_shared_borders.setChecked(True)
+    assert ui.btn_outer_edge_color.isEnabled() and ui.spin_outer_edge_width.isEnabled()
+    ui.chk_legend_histogram.setChecked(False)
+    choropleth_app._update_style_ui()
+    assert ui.btn_outer_edge_color.isEnabled()
+    ui.chk_shared_borders.setChecked(False)
+    assert not ui.btn_outer_edge_color.isEnabled() and not ui.spin_outer_edge_width.isEnabled()
@@ -0,0 +1,27 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.partitioned import PartitionedLayer, ValueTable, value_index
+
+
+def test_value_table_matches_in_memory_index(layer_files, tmp_path):
+    _, csv = layer_files
+    df = pd.read_csv(csv)
+    # Повторы ключей с пробелами: остаётся первое значение, как в value_index
+    pd.concat([df, df.assign(region=" " + df["region"], value=-1.0)]).to_csv(tmp_path / "dup.csv", index=False)
+    keys = pd.Series(["R0", "R1", "R9", "missing", "R1"])
+    expected = keys.map(value_index(str(tmp_path / "dup.csv"), "region", "value")).to_numpy(dtype="float64")
+    with ValueTable(str(tmp_path / "dup.csv"), "region", "value", chunksize=10) as table:
+        run_dir = table._run_dir
+        assert np.array_equal(table.lookup(keys), expected, equal_nan=True)
+    assert math.isnan(expected[2]) and math.isnan(expected[3])
+    assert not run_dir.exists()
+
+
+def test_filter_without_matches_is_reported(layer_files):
+    geo, _ = layer_files
+    with pytest.raises(ValueError, match="По заданному фильтру не найдено ни одного объекта"):
+        PartitionedLayer(str(geo), "name", where="name = 'nope'")
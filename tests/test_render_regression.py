@@ -0,0 +1,121 @@
+import json
+from dataclasses import replace
+from io import BytesIO
+
+import numpy as np
+import pytest
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PyQt6.QtWidgets import QTableWidgetItem
+
+from core.renderer import Renderer
+from utils import render_regression as rr
+
+BASELINE = json.loads((rr.DEFAULT_BASELINE_DIR / "baseline.json").read_text(encoding="utf-8"))
+
+
+@pytest.fixture(scope="module")
+def layers():
+    cache = {}
+
+    def get(name: str):
+        if name not in cache:
+            cache[name] = rr.LAYERS[name]()
+        return cache[name]
+
+    return get
+
+
+@pytest.mark.parametrize("case", rr.CASES, ids=lambda case: case.name)
+def test_case_matches_committed_baseline(case, layers, tmp_path):
+    data, colors = rr.render_case(case, layers(case.layer), tmp_path)
+    assert rr.compare(case, data, colors, BASELINE[case.name], rr.DEFAULT_BASELINE_DIR) == []
+
+
+# Исходная версия рисовала карту через gdf.plot с обводкой каждого полигона. Renderer
+# со снятыми общими границами должен давать ту же картинку и те же цвета регионов.
+@pytest.mark.parametrize("layer, spec", [("grid", rr.BINS), ("voronoi", rr.EXACT)], ids=["grid-bins", "voronoi-exact"])
+def test_renderer_matches_legacy_plot(layer, spec, layers):
+    gdf = layers(layer)
+    spec = replace(spec, shared_borders=False)
+    renderer = Renderer(gdf, "__value__", "name")
+
+    legacy = [rr.legacy_color(v, spec) for v in gdf["__value__"].to_numpy(dtype="float64")]
+    assert list(renderer.hex_colors(spec)) == legacy
+
+    def png(fig):
+        buf = BytesIO()
+        fig.savefig(buf, format="png", dpi=rr.DPI, bbox_inches="tight")
+        return buf.getvalue()
+
+    assert rr.image_problems(png(renderer.figure(spec)), png(rr.legacy_figure(gdf, spec))) == []
+
+
+# Ускорение меряется в одном запуске против исходной отрисовки, а не против сохранённых чисел:
+# случай с обводкой каждого полигона даёт тот же файл, что исходная версия, и запас здесь больше двух раз
+def test_stroked_png_is_faster_than_legacy_plot(layers, tmp_path):
+    case = next(case for case in rr.CASES if case.name == "grid-bins-stroked-png")
+    gdf = layers(case.layer)
+    _, seconds = rr.timed(lambda: rr.render_case(case, gdf, tmp_path), 3)
+    _, legacy_seconds = rr.timed(lambda: rr.legacy_render(case, gdf), 3)
+    assert legacy_seconds / seconds > 1.2
+
+
+# ---------------------- Инкрементальные пути on_plot ----------------------
+def _canvas_pixels(window) -> np.ndarray:
+    # Буфер холста окна как есть — с тем, что дорисовано поверх (blit), без перерисовки
+    return np.asarray(window.ui.get_figure_canvas().buffer_rgba())[..., :3].copy()
+
+
+def _fresh_pixels(window) -> np.ndarray:
+    # Та же карта, нарисованная с нуля новым Renderer в фигуру того же размера и с теми же пределами осей
+    source = window.ui.get_figure()
+    fig = Figure(figsize=source.get_size_inches(), dpi=source.dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    renderer = window.renderer
+    Renderer(renderer.gdf, renderer.value_col, renderer.key_col).draw(ax, window.spec)
+    fig.tight_layout()
+    ax.set_xlim(renderer.ax.get_xlim())
+    ax.set_ylim(renderer.ax.get_ylim())
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba())[..., :3].copy()
+
+
+def _assert_same_as_fresh(window):
+    current, fresh = _canvas_pixels(window), _fresh_pixels(window)
+    assert current.shape == fresh.shape
+    assert rr.pixel_diff(fresh, current) <= rr.MAX_PIXEL_DIFF
+
+
+@pytest.mark.parametrize("shared_borders", [False, True], ids=["stroked", "shared"])
+def test_value_edit_blit_matches_fresh_draw(choropleth_app, shared_borders):
+    window = choropleth_app
+    window.ui.chk_shared_borders.setChecked(shared_borders)
+    window.on_plot()
+    for row, text in ((0, "90"), (5, "10"), (9, "")):
+        window.ui.set_table_values_item(row, 1, QTableWidgetItem(text))
+    _assert_same_as_fresh(window)
+
+
+def test_scheme_recolor_matches_fresh_draw(choropleth_app):
+    window = choropleth_app
+    artists = window.state.counters["artists"]
+    window.ui.set_bin_table_item(1, 2, QTableWidgetItem("#ffff00"))
+    window.on_plot()
+    assert window.state.counters["artists"] == artists  # путь перекраски, без перестроения коллекций
+    window.ui.get_figure_canvas().draw()
+    _assert_same_as_fresh(window)
+
+
+def test_navigation_then_settle_matches_fresh_draw(choropleth_app):
+    window = choropleth_app
+    window.ui.chk_shared_borders.setChecked(True)
+    window.on_plot()
+    ax = window.renderer.ax
+    (x0, x1), (y0, y1) = ax.get_xlim(), ax.get_ylim()
+    ax.set_xlim(x0, (x0 + x1) / 2)
+    ax.set_ylim(y0, (y0 + y1) / 2)
+    window._on_view_settled()
+    window.ui.get_figure_canvas().draw()
+    _assert_same_as_fresh(window)
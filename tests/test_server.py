@@ -0,0 +1,55 @@
+import asyncio
+import json
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from server import RenderService
+
+
+async def _request(service: RenderService, raw: bytes) -> tuple[int, bytes]:
+    reader = asyncio.StreamReader()
+    reader.feed_data(raw)
+    reader.feed_eof()
+    status, payload, _ = await service._dispatch(reader)
+    return status, payload
+
+
+@pytest.fixture
+def service(layer_files):
+    geo, _ = layer_files
+    service = RenderService({"grid": (str(geo), "name")}, workers=1, cache_size=4)
+    yield service
+    service.pool.shutdown(wait=True, cancel_futures=True)
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        b"POST /render HTTP/1.1\r\nContent-Length: abc\r\n\r\n{}",
+        b"POST /render HTTP/1.1\r\nContent-Length: -5\r\n\r\n{}",
+        b"POST /render HTTP/1.1\r\nContent-Length: 100\r\n\r\n{}",
+    ],
+)
+def test_malformed_content_length_is_bad_request(service, raw):
+    status, _ = asyncio.run(_request(service, raw))
+    assert status == 400
+
+
+def test_pool_is_recreated_after_worker_crash(service):
+    body = json.dumps({"values": {"R0": 10}, "scheme": {"bins": [{"lower": 0, "upper": 50, "color_hex": "#ff0000"}]}, "dpi": 20, "figsize": [2, 2]}).encode()
+    raw = b"POST /render HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        # Аварийное завершение рабочего процесса ломает весь пул
+        with pytest.raises(BrokenProcessPool):
+            await loop.run_in_executor(service.pool, os._exit, 1)
+        with pytest.raises(BrokenProcessPool):
+            await service.render(body)
+        return await _request(service, raw)
+
+    status, payload = asyncio.run(scenario())
+    assert status == 200 and payload.startswith(b"\x89PNG")
+    assert service.stats["pool_restarts"] == 1
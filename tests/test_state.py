@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+from matplotlib.colors import to_rgba
+
+from core.state import CLASSIFICATION, COLORS, MapState
+
+
+def test_memo_recomputes_only_after_input_change():
+    state = MapState()
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+
+    assert state.memo("classification", CLASSIFICATION, compute) == 1
+    assert state.memo("classification", CLASSIFICATION, compute) == 1
+    state.touch("style")  # не входит в CLASSIFICATION
+    assert state.memo("classification", CLASSIFICATION, compute) == 1
+    state.touch("values")
+    assert state.memo("classification", CLASSIFICATION, compute) == 2
+    assert state.counters["classification"] == 2
+
+
+def test_set_same_value_keeps_version():
+    state = MapState()
+    assert state.set("mode", "bins", "scheme")
+    version = state.versions["scheme"]
+    assert not state.set("mode", "bins", "scheme")
+    assert state.versions["scheme"] == version
+    assert state.set("mode", "exact", "scheme")
+    assert state.versions["scheme"] == version + 1
+
+
+def test_stamp_marks_current_without_counting():
+    state = MapState()
+    state.record("facecolors", COLORS)
+    state.touch("values")
+    assert not state.is_current("facecolors", COLORS)
+    state.stamp("facecolors", COLORS)
+    assert state.is_current("facecolors", COLORS)
+    assert state.counters["facecolors"] == 1
+
+
+def test_mode_reselection_does_not_replot(choropleth_app):
+    window = choropleth_app
+    before = dict(window.state.counters)
+    window.ui.get_radio_bins().setChecked(True)
+    window.on_mode_changed()
+    assert dict(window.state.counters) == before
+
+
+def test_same_key_reselection_keeps_table(choropleth_app):
+    window = choropleth_app
+    before = window.state.counters["table"]
+    window.on_geo_key_changed("name")
+    assert window.state.counters["table"] == before
+    window.on_geo_key_changed("code")
+    assert window.state.counters["table"] == before + 1
+
+
+def _edit_value(window, row: int, text: str):
+    from PyQt6.QtWidgets import QTableWidgetItem
+
+    window.ui.set_table_values_item(row, 1, QTableWidgetItem(text))
+
+
+def _drawn_color(window, row: int) -> tuple:
+    return tuple(window.renderer.collection.get_facecolor()[row])
+
+
+def test_value_edit_repaints_in_place(choropleth_app):
+    window = choropleth_app
+    counters = window.state.counters
+    artists, facecolors = counters["artists"], counters["facecolors"]
+
+    _edit_value(window, 0, "90")
+    window.on_plot()
+    # Классы пересчитаны по новому значению, но коллекции не перестроены и не перекрашены заново
+    assert counters["artists"] == artists
+    assert counters["facecolors"] == facecolors
+    assert _drawn_color(window, 0) == to_rgba("#0000ff")
+
+
+def test_value_edit_after_key_change_reaches_canvas(choropleth_app):
+    window = choropleth_app
+    window.ui.cmb_geo_key.setCurrentText("code")
+    assert window.renderer.key_col == "code"
+
+    _edit_value(window, 0, "90")
+    window.on_plot()
+    region = window.ui.get_table_values_item(0, 0).text()
+    row = int(np.flatnonzero(window.renderer.gdf["code"] == region)[0])
+    assert window.renderer.gdf[window.renderer.value_col].iloc[row] == 90
+    assert _drawn_color(window, row) == to_rgba("#0000ff")
+
+
+def test_value_edit_without_matching_rows_is_not_stamped(choropleth_app):
+    window = choropleth_app
+    window.renderer.key_col = "missing"  # правка не найдёт регион на холсте
+    _edit_value(window, 0, "90")
+    assert not window.state.is_current("facecolors", COLORS)
+    window.renderer.key_col = "name"
+    recolors = window.state.counters["facecolors"]
+    window.on_plot()
+    assert window.state.counters["facecolors"] == recolors + 1
+    assert _drawn_color(window, 0) == to_rgba("#0000ff")
+
+
+def test_legend_toggle_reuses_class_statistics(choropleth_app, layer_files):
+    window = choropleth_app
+    counters = window.state.counters
+    classification, artists = counters["classification"], counters["artists"]
+
+    window.ui.chk_legend.setChecked(True)
+    window.ui.chk_legend_counts.setChecked(True)
+    stats = counters["class_stats"]
+    window.ui.chk_legend_histogram.setChecked(True)
+    window.ui.chk_legend.setChecked(False)
+    window.ui.chk_legend.setChecked(True)
+
+    assert counters["classification"] == classification
+    assert counters["artists"] == artists
+    assert counters["class_stats"] == stats == 1
+    assert counters["legend"] > 0
+    # Числа регионов по классам и «нет данных» — по исходному CSV и правилам интервалов
+    values = pd.read_csv(layer_files[1])["value"].to_numpy()
+    expected = [
+        ((values >= 0) & (values < 30)).sum(),
+        ((values >= 30) & (values < 60)).sum(),
+        ((values >= 60) & (values <= 100)).sum(),
+        np.isnan(values).sum(),
+    ]
+    assert window.renderer.class_stats(window.spec).counts.tolist() == expected
@@ -0,0 +1,27 @@
+import geopandas as gpd
+import pandas as pd
+import pytest
+import shapely
+
+from utils.vector_tiles import export_vector_tiles
+
+
+def _layer(*boxes) -> tuple[gpd.GeoDataFrame, pd.DataFrame]:
+    gdf = gpd.GeoDataFrame({"region": [str(i) for i in range(len(boxes))]}, geometry=[shapely.box(*b) for b in boxes], crs="EPSG:4326")
+    properties = pd.DataFrame({"region": gdf["region"], "value": 1.0, "class": 0, "color": "#ff0000"})
+    return gdf, properties
+
+
+def test_sparse_layer_writes_only_tiles_with_features(tmp_path):
+    # Два крошечных объекта на разных концах материка: в охвате слоя на 16-м уровне миллиарды тайлов
+    gdf, properties = _layer((30, 50, 30.01, 50.01), (130, 40, 130.01, 40.01))
+    written = export_vector_tiles(gdf, properties, str(tmp_path / "tiles"), 0, 16, workers=1)
+    tiles = list((tmp_path / "tiles").glob("*/*/*.pbf"))
+    assert written == len(tiles) <= 2 * 4 * 17
+
+
+def test_refuses_exports_above_tile_limit(tmp_path):
+    gdf, properties = _layer((30, 45, 150, 75))
+    with pytest.raises(ValueError, match="Слишком много тайлов"):
+        export_vector_tiles(gdf, properties, str(tmp_path / "tiles.mbtiles"), 0, 22)
+    assert not (tmp_path / "tiles.mbtiles").exists()
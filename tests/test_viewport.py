@@ -0,0 +1,36 @@
+import numpy as np
+import shapely
+
+from core.paths import geometry_paths
+from core.viewport import MAX_CACHED_LEVELS, ViewportIndex
+from utils.render_regression import voronoi_layer
+
+
+def _index(n: int = 500) -> ViewportIndex:
+    geoms = voronoi_layer(n).geometry.values
+    return ViewportIndex(geoms, geometry_paths(geoms))
+
+
+def test_simplifies_only_requested_rows():
+    index = _index()
+    minx, miny, maxx, maxy = shapely.total_bounds(index.geoms)
+    cx, cy = (minx + maxx) / 2, (miny + maxy) / 2
+    rows = index.visible(cx, cy, cx + (maxx - minx) / 8, cy + (maxy - miny) / 8)
+    level = ViewportIndex.level_for((maxx - minx) / 2000)
+    paths = index.paths(rows, level)
+
+    # Те же контуры, что при упрощении всего слоя, но остальные строки не тронуты
+    reference = geometry_paths(shapely.simplify(index.geoms[rows], 2.0 ** level, preserve_topology=True))
+    assert all(np.array_equal(a.vertices, b.vertices) for a, b in zip(paths, reference))
+    items, ready = index._levels[level]
+    assert ready.sum() == len(rows) < len(index.geoms)
+    index.close()
+
+
+def test_cached_levels_are_bounded():
+    index = _index(50)
+    rows = np.arange(len(index.geoms))
+    for level in range(-4, 8):
+        index.paths(rows, level)
+    assert len(index._levels) == MAX_CACHED_LEVELS
+    assert list(index._levels) == list(range(8 - MAX_CACHED_LEVELS, 8))
@@ -0,0 +1,40 @@
+import os
+
+import geopandas as gpd
+import shapely
+
+from core.cache import LayerCache
+from core.workspace import Workspace
+
+
+def _layer(n: int) -> gpd.GeoDataFrame:
+    return gpd.GeoDataFrame({"name": [f"R{i}" for i in range(n)]}, geometry=[shapely.box(i, 0, i + 1, 1) for i in range(n)])
+
+
+def test_spilled_layers_are_removed_on_close(tmp_path):
+    workspace = Workspace(memory_budget=1, cache=LayerCache(str(tmp_path)))
+    workspace.add_layer("a.geojson", _layer(50), "name")
+    workspace.add_layer("b.geojson", _layer(50), "name")
+    assert not workspace.is_in_memory("a")
+    run_dir = workspace.cache.spill_dir
+    assert list(run_dir.glob("*.pkl"))
+
+    # Выгруженный слой восстанавливается из каталога запуска
+    workspace.activate("a")
+    assert workspace.is_in_memory("a") and not workspace.is_in_memory("b")
+
+    workspace.close()
+    assert not run_dir.exists()
+    assert list((tmp_path / "spill").iterdir()) == []
+
+
+def test_stale_spill_directories_are_swept(tmp_path):
+    # Каталог процесса, который завершился, не закрыв кэш (pid заведомо не существует)
+    stale = tmp_path / "spill" / "run-999999999-abc"
+    stale.mkdir(parents=True)
+    (stale / "old.pkl").write_bytes(b"x")
+    cache = LayerCache(str(tmp_path))
+    cache.spill("token", _layer(3))
+    assert not stale.exists()
+    assert cache.spill_dir.name.startswith(f"run-{os.getpid()}-")
+    cache.close()
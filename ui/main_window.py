@@ -1,3 +1,5 @@
+from typing import Optional
+
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QAction, QColor
 from PyQt6.QtWidgets import (
@@ -11,8 +13,11 @@ from PyQt6.QtWidgets import (
     QGroupBox,
     QHBoxLayout,
     QHeaderView,
+    QInputDialog,
     QLabel,
     QLineEdit,
+    QListWidget,
+    QListWidgetItem,
     QMainWindow,
     QMessageBox,
     QPushButton,
@@ -43,8 +48,18 @@ class UIMainWindow:
 
         # UI elements that need to be accessed by the main app logic
         self.lbl_geo_path = QLabel("— не загружено —")
+        self.cmb_layers = QComboBox()
         self.cmb_geo_key = QComboBox()
+        self.chk_lean = QCheckBox("Компактный режим (только поле региона и геометрия)")
+        self.lbl_memory = QLabel("—")
+        self.edit_geo_where = QLineEdit()
+        self.edit_geo_where.setPlaceholderText("например: federal_district = 'Центральный'")
+        self.edit_geo_bbox = QLineEdit()
+        self.edit_geo_bbox.setPlaceholderText("minx, miny, maxx, maxy (в СК файла)")
+        self.edit_geo_columns = QLineEdit()
+        self.edit_geo_columns.setPlaceholderText("поля через запятую (пусто — все)")
         self.lbl_csv_path = QLabel("— не загружено —")
+        self.cmb_datasets = QComboBox()
         self.cmb_csv_key = QComboBox()
         self.cmb_csv_val = QComboBox()
         self.tbl_values = QTableWidget()
@@ -52,6 +67,13 @@ class UIMainWindow:
         self.btn_no_data_color = QPushButton("#D3D3D3")
         self.btn_edge_color = QPushButton("#444444")
         self.spin_edge_width = QDoubleSpinBox()
+        self.btn_outer_edge_color = QPushButton("#444444")
+        self.spin_outer_edge_width = QDoubleSpinBox()
+        self.chk_shared_borders = QCheckBox("Рисовать общие границы один раз")
+        self.chk_legend = QCheckBox("Показывать легенду")
+        self.chk_legend_counts = QCheckBox("Число регионов в классе")
+        self.chk_legend_ranges = QCheckBox("Фактический диапазон значений")
+        self.chk_legend_histogram = QCheckBox("Гистограмма значений")
 
         # New UI elements for mode selection and exact values
         self.radio_bins = QRadioButton("Интервалы")
@@ -81,6 +103,7 @@ class UIMainWindow:
         right_layout = QVBoxLayout(right_panel)
         right_layout.addWidget(self.toolbar)
         right_layout.addWidget(self.canvas)
+        right_layout.addWidget(self._build_export_box())
 
         splitter.addWidget(left_panel)
         splitter.addWidget(right_panel)
@@ -103,9 +126,15 @@ class UIMainWindow:
         self.act_save_png = QAction("Сохранить PNG…", self.main_window)
         toolbar.addAction(self.act_save_png)
 
+        self.act_save_png8 = QAction("Сохранить PNG (палитра)…", self.main_window)
+        toolbar.addAction(self.act_save_png8)
+
         self.act_save_svg = QAction("Сохранить SVG…", self.main_window)
         toolbar.addAction(self.act_save_svg)
 
+        self.act_export_tiles = QAction("Экспорт векторных тайлов…", self.main_window)
+        toolbar.addAction(self.act_export_tiles)
+
         toolbar.addSeparator()
 
         self.act_load_scheme = QAction("Загрузить схему…", self.main_window)
@@ -121,14 +150,21 @@ class UIMainWindow:
         g_group = QGroupBox("Геоданные (GeoJSON/Shapefile)")
         g_form = QFormLayout(g_group)
         self.btn_geo_open = QPushButton("Загрузить…")
+        g_form.addRow("Слой:", self.cmb_layers)
         g_form.addRow("Файл:", self.lbl_geo_path)
         g_form.addRow("Поле региона:", self.cmb_geo_key)
+        g_form.addRow(self.chk_lean)
+        g_form.addRow("Фильтр (WHERE):", self.edit_geo_where)
+        g_form.addRow("Охват:", self.edit_geo_bbox)
+        g_form.addRow("Поля:", self.edit_geo_columns)
+        g_form.addRow("Память:", self.lbl_memory)
         g_form.addRow(self.btn_geo_open)
 
         c_group = QGroupBox("Показатели (CSV)")
         c_form = QFormLayout(c_group)
         self.btn_csv_open = QPushButton("Загрузить…")
         self.btn_join = QPushButton("Объединить с геоданными")
+        c_form.addRow("Набор:", self.cmb_datasets)
         c_form.addRow("Файл:", self.lbl_csv_path)
         c_form.addRow("Столбец региона:", self.cmb_csv_key)
         c_form.addRow("Столбец значения:", self.cmb_csv_val)
@@ -214,12 +250,47 @@ class UIMainWindow:
         self.spin_edge_width.setDecimals(2)
         self.spin_edge_width.setRange(0.0, 5.0)
         self.spin_edge_width.setValue(0.4)
+        self.spin_outer_edge_width.setDecimals(2)
+        self.spin_outer_edge_width.setRange(0.0, 5.0)
+        self.spin_outer_edge_width.setValue(0.4)
+        self.chk_shared_borders.setChecked(False)
 
         form.addRow("Цвет для отсутствующих значений:", self.btn_no_data_color)
         form.addRow("Цвет границ регионов:", self.btn_edge_color)
         form.addRow("Толщина границ:", self.spin_edge_width)
+        form.addRow(self.chk_shared_borders)
+        form.addRow("Цвет внешней границы:", self.btn_outer_edge_color)
+        form.addRow("Толщина внешней границы:", self.spin_outer_edge_width)
+        form.addRow(self.chk_legend)
+        form.addRow(self.chk_legend_counts)
+        form.addRow(self.chk_legend_ranges)
+        form.addRow(self.chk_legend_histogram)
         return w
 
+    def _build_export_box(self) -> QWidget:
+        box = QGroupBox("Экспорт")
+        lay = QVBoxLayout(box)
+        row = QHBoxLayout()
+        self.chk_export_formats = {
+            "png": QCheckBox("PNG"),
+            "svg": QCheckBox("SVG"),
+            "pdf": QCheckBox("PDF"),
+            "png8": QCheckBox("PNG (палитра)"),
+        }
+        for fmt, chk in self.chk_export_formats.items():
+            chk.setChecked(fmt in ("png", "svg"))
+            row.addWidget(chk)
+        row.addStretch(1)
+        self.btn_export = QPushButton("Экспортировать…")
+        self.btn_cancel_export = QPushButton("Отменить")
+        row.addWidget(self.btn_export)
+        row.addWidget(self.btn_cancel_export)
+        lay.addLayout(row)
+        self.lst_exports = QListWidget()
+        self.lst_exports.setMaximumHeight(90)
+        lay.addWidget(self.lst_exports)
+        return box
+
     def _build_actions_box(self) -> QWidget:
         box = QGroupBox("Действия")
         lay = QHBoxLayout(box)
@@ -288,6 +359,24 @@ class UIMainWindow:
         path, _ = QFileDialog.getSaveFileName(self.main_window, title, "", filter)
         return path
 
+    def set_layer_combobox_items(self, items: list[str], current: str):
+        self.cmb_layers.blockSignals(True)
+        self.cmb_layers.clear()
+        self.cmb_layers.addItems(items)
+        self.cmb_layers.setCurrentText(current)
+        self.cmb_layers.blockSignals(False)
+
+    def set_dataset_combobox_items(self, items: list[str], current: str):
+        self.cmb_datasets.blockSignals(True)
+        self.cmb_datasets.clear()
+        self.cmb_datasets.addItems(items)
+        self.cmb_datasets.setCurrentText(current)
+        self.cmb_datasets.blockSignals(False)
+
+    def get_int_input(self, title: str, label: str, value: int, min_value: int, max_value: int) -> Optional[int]:
+        result, ok = QInputDialog.getInt(self.main_window, title, label, value, min_value, max_value)
+        return result if ok else None
+
     def clear_geo_key_combobox(self):
         self.cmb_geo_key.clear()
 
@@ -335,12 +424,64 @@ class UIMainWindow:
     def set_edge_color_button_text(self, text: str):
         self.btn_edge_color.setText(text)
 
+    def set_outer_edge_color_button_text(self, text: str):
+        self.btn_outer_edge_color.setText(text)
+
+    def set_outer_edge_width_spinbox_value(self, value: float):
+        self.spin_outer_edge_width.setValue(value)
+
+    def set_shared_borders_checked(self, checked: bool):
+        self.chk_shared_borders.setChecked(checked)
+        self.btn_outer_edge_color.setEnabled(checked)
+        self.spin_outer_edge_width.setEnabled(checked)
+
+    def get_legend_options(self) -> dict[str, bool]:
+        return {
+            "legend": self.chk_legend.isChecked(),
+            "legend_counts": self.chk_legend_counts.isChecked(),
+            "legend_ranges": self.chk_legend_ranges.isChecked(),
+            "legend_histogram": self.chk_legend_histogram.isChecked(),
+        }
+
+    def set_legend_options(self, legend: bool, counts: bool, ranges: bool, histogram: bool):
+        for chk, checked in (
+            (self.chk_legend, legend),
+            (self.chk_legend_counts, counts),
+            (self.chk_legend_ranges, ranges),
+            (self.chk_legend_histogram, histogram),
+        ):
+            chk.blockSignals(True)
+            chk.setChecked(checked)
+            chk.blockSignals(False)
+
     def get_figure_canvas(self):
         return self.canvas
 
     def get_figure(self):
         return self.figure
 
+    def is_lean_mode_checked(self) -> bool:
+        return self.chk_lean.isChecked()
+
+    def get_geo_where_text(self) -> str:
+        return self.edit_geo_where.text().strip()
+
+    def get_geo_bbox_text(self) -> str:
+        return self.edit_geo_bbox.text().strip()
+
+    def get_geo_columns_text(self) -> str:
+        return self.edit_geo_columns.text().strip()
+
+    def set_memory_usage(self, usage: dict[str, int]):
+        if not usage:
+            self.lbl_memory.setText("—")
+            self.lbl_memory.setToolTip("")
+            return
+        total = sum(usage.values())
+        self.lbl_memory.setText(f"{total / 2**20:.1f} МБ")
+        lines = [f"{col}: {nbytes / 2**20:.2f} МБ" for col, nbytes in sorted(usage.items(), key=lambda kv: -kv[1])]
+        self.lbl_memory.setToolTip("\n".join(lines))
+
     def get_geo_path_label(self) -> QLabel:
         return self.lbl_geo_path
 
@@ -352,16 +493,23 @@ class UIMainWindow:
         self.act_open_geo.triggered.connect(app_instance.on_open_geo)
         self.act_open_csv.triggered.connect(app_instance.on_open_csv)
         self.act_save_png.triggered.connect(app_instance.on_save_png)
+        self.act_save_png8.triggered.connect(app_instance.on_save_indexed_png)
         self.act_save_svg.triggered.connect(app_instance.on_save_svg)
+        self.act_export_tiles.triggered.connect(app_instance.on_export_tiles)
+        self.btn_export.clicked.connect(app_instance.on_export_formats)
+        self.btn_cancel_export.clicked.connect(app_instance.on_cancel_export)
         self.act_load_scheme.triggered.connect(app_instance.on_load_scheme)
         self.act_save_scheme.triggered.connect(app_instance.on_save_scheme)
 
+        self.cmb_layers.currentTextChanged.connect(app_instance.on_layer_changed)
+        self.cmb_datasets.currentTextChanged.connect(app_instance.on_dataset_changed)
         self.cmb_geo_key.currentTextChanged.connect(app_instance.on_geo_key_changed)
         self.btn_geo_open.clicked.connect(app_instance.on_open_geo)
         self.btn_csv_open.clicked.connect(app_instance.on_open_csv)
         self.btn_join.clicked.connect(app_instance.on_join)
         self.tbl_values.itemChanged.connect(app_instance.on_table_value_edited)
 
+        self.tbl_bins.itemChanged.connect(app_instance.on_bin_edited)
         self.btn_add_bin.clicked.connect(app_instance.on_add_bin)
         self.btn_del_bin.clicked.connect(app_instance.on_delete_bin)
         self.btn_color_bin.clicked.connect(app_instance.on_pick_color_for_selected_bin)
@@ -369,6 +517,11 @@ class UIMainWindow:
         self.btn_no_data_color.clicked.connect(lambda: app_instance.on_pick_no_data_color())
         self.btn_edge_color.clicked.connect(lambda: app_instance.on_pick_edge_color())
         self.spin_edge_width.valueChanged.connect(app_instance.on_edge_width_changed)
+        self.btn_outer_edge_color.clicked.connect(lambda: app_instance.on_pick_outer_edge_color())
+        self.spin_outer_edge_width.valueChanged.connect(app_instance.on_outer_edge_width_changed)
+        self.chk_shared_borders.toggled.connect(app_instance.on_shared_borders_toggled)
+        for chk in (self.chk_legend, self.chk_legend_counts, self.chk_legend_ranges, self.chk_legend_histogram):
+            chk.toggled.connect(app_instance.on_legend_options_changed)
 
         self.btn_plot.clicked.connect(app_instance.on_plot)
 
@@ -403,6 +556,27 @@ class UIMainWindow:
     def get_exact_table_item(self, row: int, col: int) -> QTableWidgetItem:
         return self.tbl_exact_values.item(row, col)
 
+    def get_export_formats(self) -> list[str]:
+        return [fmt for fmt, chk in self.chk_export_formats.items() if chk.isChecked()]
+
+    def add_export_item(self, text: str) -> QListWidgetItem:
+        item = QListWidgetItem(text)
+        self.lst_exports.addItem(item)
+        self.lst_exports.scrollToItem(item)
+        return item
+
+    def trim_export_items(self, keep: int, active: list[QListWidgetItem]):
+        # Убирает самые старые завершённые строки, пока в списке больше keep строк
+        row = 0
+        while self.lst_exports.count() > keep and row < self.lst_exports.count():
+            if self.lst_exports.item(row) in active:
+                row += 1
+            else:
+                self.lst_exports.takeItem(row)
+
+    def get_selected_export_rows(self) -> list[int]:
+        return [index.row() for index in self.lst_exports.selectedIndexes()]
+
     def get_selected_exact_row(self) -> int:
         return self.tbl_exact_values.currentRow()
 
@@ -0,0 +1,211 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from copy import deepcopy
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+from core.models import MapSpec
+from core.renderer import Renderer, encode_indexed_png
+
+FORMATS = ("png", "svg", "pdf", "png8")
+
+
+class CancelledError(Exception):
+    pass
+
+
+@dataclass
+class ExportJob:
+    path: str
+    fmt: str
+    status: str = "queued"        # queued | rendering | encoding | writing | done | cancelled | failed
+    progress: float = 0.0
+    error: Optional[str] = None
+    result: Any = None
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+    _future: Optional[Future] = field(default=None, repr=False)
+
+    def cancel(self):
+        self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            self.status = "cancelled"
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "cancelled", "failed")
+
+
+class _CaptureCanvas(FigureCanvasAgg):
+    # savefig(format="capture") проходит весь путь savefig (bbox_inches="tight", dpi),
+    # но вместо кодирования PNG отдаёт готовый буфер RGBA
+    def print_capture(self, sink: list, **kwargs):
+        FigureCanvasAgg.draw(self)
+        sink.append(np.array(self.buffer_rgba()))
+
+
+class _Batch:
+    # Снимок на момент постановки в очередь: копия значений и схемы и уже построенная фигура,
+    # поэтому правки в окне после submit в файл не попадают. Фигура у каждого пакета своя и не
+    # делит состояние Agg ни с холстом окна, ни с другими пакетами — они рисуют параллельно.
+    # Форматы одного пакета рисуют общую фигуру по очереди, под блокировкой пакета.
+    def __init__(self, renderer: Renderer, spec: MapSpec, dpi: int, figsize, view, formats):
+        self.renderer = renderer.snapshot()
+        self.spec = deepcopy(spec)
+        self.dpi = dpi
+        self.figsize = figsize
+        self.view = view
+        self.lock = threading.Lock()
+        self.figure: Optional[Figure] = None
+        if any(fmt != "png8" for fmt in formats):
+            self.figure = self.renderer.figure(self.spec, figsize=figsize, view=view)
+            _CaptureCanvas(self.figure)
+
+
+class ExportQueue:
+    def __init__(self, workers: Optional[int] = None):
+        self.pool = ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1))
+        self.jobs: List[ExportJob] = []
+
+    def submit(
+        self,
+        renderer: Renderer,
+        spec: MapSpec,
+        targets: List[Tuple[str, str]],
+        dpi: int = 300,
+        figsize=(6, 6),
+        view=None,
+        progress: Optional[Callable[[ExportJob], None]] = None,
+    ) -> List[ExportJob]:
+        # targets — пары (формат, путь). progress вызывается из рабочих потоков при каждой смене этапа.
+        for fmt, _ in targets:
+            if fmt not in FORMATS:
+                raise ValueError(f"Неподдерживаемый формат: {fmt}")
+        self._prune()
+        batch = _Batch(renderer, spec, dpi, figsize, view, [fmt for fmt, _ in targets])
+        jobs = []
+        for fmt, path in targets:
+            job = ExportJob(path, fmt)
+            job._future = self.pool.submit(self._run, batch, job, progress or (lambda job: None))
+            jobs.append(job)
+        self.jobs.extend(jobs)
+        return jobs
+
+    def submit_task(
+        self,
+        path: str,
+        fmt: str,
+        task: Callable[[Callable[[int, int], None]], Any],
+        progress: Optional[Callable[[ExportJob], None]] = None,
+    ) -> ExportJob:
+        # Долгий экспорт без matplotlib (например, векторные тайлы) в том же пуле.
+        # task получает функцию report(done, total); при отмене она бросает CancelledError.
+        self._prune()
+        job = ExportJob(path, fmt)
+        job._future = self.pool.submit(self._run_task, task, job, progress or (lambda job: None))
+        self.jobs.append(job)
+        return job
+
+    def _prune(self):
+        # Очередь помнит только незавершённые задачи
+        self.jobs = [job for job in self.jobs if not job.finished]
+
+    def cancel_all(self):
+        for job in self.jobs:
+            if not job.finished:
+                job.cancel()
+
+    def shutdown(self, wait: bool = True):
+        self.pool.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _step(self, job: ExportJob, status: str, value: float, progress: Callable[[ExportJob], None]):
+        if job.cancelled:
+            raise CancelledError()
+        job.status = status
+        job.progress = value
+        progress(job)
+
+    def _run(self, batch: _Batch, job: ExportJob, progress: Callable[[ExportJob], None]):
+        try:
+            self._step(job, "rendering", 0.1, progress)
+            rendered = self._render(batch, job.fmt)
+            self._step(job, "encoding", 0.5, progress)
+            data = self._encode(job.fmt, rendered, batch.dpi)
+            self._step(job, "writing", 0.8, progress)
+            _write_atomic(job.path, data, job)
+            job.status, job.progress = "done", 1.0
+        except CancelledError:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status, job.error = "failed", str(e)
+        progress(job)
+
+    def _run_task(self, task: Callable, job: ExportJob, progress: Callable[[ExportJob], None]):
+        def report(done: int, total: int):
+            self._step(job, "writing", done / total if total else 1.0, progress)
+
+        try:
+            self._step(job, "writing", 0.0, progress)
+            job.result = task(report)
+            job.status, job.progress = "done", 1.0
+        except CancelledError:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status, job.error = "failed", str(e)
+        progress(job)
+
+    def _render(self, batch: _Batch, fmt: str):
+        if fmt == "png8":
+            # Палитровый PNG рисуется без сглаживания — собственной фигурой по снимку значений
+            return batch.renderer.indexed(batch.spec, dpi=batch.dpi, figsize=batch.figsize, view=batch.view)
+        with batch.lock:
+            if fmt == "png":
+                sink = []
+                batch.figure.savefig(sink, format="capture", dpi=batch.dpi, bbox_inches="tight")
+                return sink[0]
+            buf = BytesIO()
+            batch.figure.savefig(buf, format=fmt, dpi=batch.dpi, bbox_inches="tight")
+            return buf.getvalue()
+
+    def _encode(self, fmt: str, rendered, dpi: int) -> bytes:
+        if fmt in ("svg", "pdf"):
+            return rendered
+        buf = BytesIO()
+        if fmt == "png8":
+            index, palette = rendered
+            encode_indexed_png(buf, index, palette, dpi=dpi)
+        else:
+            Image.fromarray(rendered, mode="RGBA").save(buf, format="PNG", dpi=(dpi, dpi))
+        return buf.getvalue()
+
+
+def _write_atomic(path: str, data: bytes, job: Optional[ExportJob] = None, chunk: int = 4 * 2**20):
+    # Пишем во временный файл рядом с целевым и переименовываем: при сбое или отмене
+    # на месте остаётся прежний файл, а не половина нового
+    target = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for start in range(0, len(data), chunk):
+                if job is not None and job.cancelled:
+                    raise CancelledError()
+                f.write(data[start:start + chunk])
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
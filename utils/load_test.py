@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import csv
+import json
+import random
+import time
+from collections import Counter
+from typing import Optional
+
+# Нагрузочный клиент для server.py: много одновременных запросов /render.
+#
+#   python server.py --layer regions=data/russia.geojson --key regions=name --workers 1
+#   python -m utils.load_test --csv values.csv --key-csv region --value value --scheme scheme.json -n 200 -c 20
+#
+# Повторите с --workers 2, 4 … у сервера и сравните req/s. --distinct задаёт долю
+# уникальных запросов: остальные повторяют уже отправленные и попадают в кэш сервера.
+
+
+def load_values(path: str, key_col: str, val_col: str) -> dict[str, float]:
+    values = {}
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            try:
+                values[row[key_col].strip()] = float(row[val_col])
+            except (TypeError, ValueError):
+                continue
+    return values
+
+
+def make_bodies(args, values: dict[str, float], scheme: dict) -> list[bytes]:
+    rng = random.Random(args.seed)
+    bodies: list[bytes] = []
+    for i in range(args.requests):
+        if bodies and rng.random() >= args.distinct:
+            bodies.append(rng.choice(bodies))
+            continue
+        # Небольшой шум в значениях делает запрос уникальным для кэша сервера
+        noisy = {k: v * (1 + rng.uniform(-0.01, 0.01)) for k, v in values.items()}
+        req = {"values": noisy, "scheme": scheme, "format": args.format, "dpi": args.dpi}
+        if args.layer:
+            req["layer"] = args.layer
+        bodies.append(json.dumps(req, ensure_ascii=False).encode("utf-8"))
+    return bodies
+
+
+async def request(host: str, port: int, method: str, target: str, body: bytes = b"") -> tuple[int, bytes]:
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(
+            f"{method} {target} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+            + body
+        )
+        await writer.drain()
+        data = await reader.read()
+    finally:
+        writer.close()
+    head, _, payload = data.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1]) if head else 0
+    return status, payload
+
+
+async def run(args) -> dict:
+    with open(args.scheme, "r", encoding="utf-8") as f:
+        scheme = json.load(f)
+    bodies = make_bodies(args, load_values(args.csv, args.key_csv, args.value), scheme)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: list[float] = []
+    statuses: Counter[int] = Counter()
+
+    async def one(body: bytes):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                status, _ = await request(args.host, args.port, "POST", "/render", body)
+            except OSError:
+                status = 0
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(b) for b in bodies))
+    elapsed = time.perf_counter() - started
+
+    _, metrics = await request(args.host, args.port, "GET", "/metrics")
+    lat = sorted(latencies)
+
+    def pct(p: float) -> Optional[float]:
+        return round(lat[min(int(p * len(lat)), len(lat) - 1)] * 1000, 1) if lat else None
+
+    return {
+        "requests": len(bodies),
+        "concurrency": args.concurrency,
+        "seconds": round(elapsed, 3),
+        "req_per_s": round(len(bodies) / elapsed, 2) if elapsed else None,
+        "statuses": dict(statuses),
+        "latency_ms": {"p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99)},
+        "server": json.loads(metrics or b"{}"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочная проверка сервиса отрисовки server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--layer", help="имя слоя на сервере (по умолчанию — первый)")
+    parser.add_argument("--csv", required=True, help="CSV со значениями регионов")
+    parser.add_argument("--key-csv", required=True, help="поле региона в CSV")
+    parser.add_argument("--value", required=True, help="поле значения в CSV")
+    parser.add_argument("--scheme", required=True, help="файл схемы JSON")
+    parser.add_argument("-n", "--requests", type=int, default=200, help="всего запросов")
+    parser.add_argument("-c", "--concurrency", type=int, default=20, help="одновременных запросов")
+    parser.add_argument("--distinct", type=float, default=1.0, help="доля уникальных запросов (0..1)")
+    parser.add_argument("--format", default="png", choices=("png", "png8", "svg"))
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import argparse
+import hashlib
+import json
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, replace
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Optional
+from xml.etree import ElementTree
+
+import numpy as np
+import geopandas as gpd
+import shapely
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+from core.cache import LayerCache
+from core.models import Bin, ExactValue, MapSpec
+from core.partitioned import PartitionedLayer, PartitionedRenderer, value_index
+from core.renderer import Renderer
+from utils.export_queue import ExportQueue
+
+# Проверка того, что оптимизации не меняют результат отрисовки.
+#
+#   python -m utils.render_regression            # сравнить с эталоном и показать ускорение
+#   python -m utils.render_regression --update   # перезаписать эталон (после намеренного изменения вида)
+#
+# Эталон хранится в репозитории (tests/data/render_baseline) и проверяется тестами pytest.
+# Растровые результаты сравниваются по перцептивному хэшу и по доле отличающихся пикселей,
+# массивы цветов регионов — точно. Время каждого случая — лучшее из нескольких повторов — сравнивается
+# в том же запуске со временем исходной отрисовки (gdf.plot), так что ускорение не зависит от машины.
+
+DEFAULT_BASELINE_DIR = Path(__file__).resolve().parent.parent / "tests" / "data" / "render_baseline"
+DPI = 100
+HASH_SIZE = 16
+MAX_HASH_DISTANCE = 6        # из HASH_SIZE ** 2 бит
+MAX_PIXEL_DIFF = 0.002       # доля пикселей, отличающихся больше чем на PIXEL_THRESHOLD
+PIXEL_THRESHOLD = 16
+SVG_STYLE_PROPERTIES = ("fill", "stroke", "stroke-width")
+
+
+# ---------------------- Тестовые слои и схемы ----------------------
+def grid_layer(n: int = 30) -> gpd.GeoDataFrame:
+    # Регулярная сетка с дырами и мультиполигонами — частые источники ошибок при построении путей
+    cells, names = [], []
+    for i in range(n):
+        for j in range(n):
+            cell = shapely.box(30 + i * 0.5, 50 + j * 0.5, 30.5 + i * 0.5, 50.5 + j * 0.5)
+            if (i + j) % 11 == 0:
+                cell = cell.difference(shapely.box(30.15 + i * 0.5, 50.15 + j * 0.5, 30.35 + i * 0.5, 50.35 + j * 0.5))
+            if (i * n + j) % 17 == 0:
+                cell = shapely.multipolygons([cell, shapely.box(30 + i * 0.5, 48 - j * 0.02, 30.2 + i * 0.5, 47.99 - j * 0.02)])
+            cells.append(cell)
+            names.append(f"G{i:02d}{j:02d}")
+    gdf = gpd.GeoDataFrame({"name": names}, geometry=cells, crs="EPSG:4326").to_crs("EPSG:3995")
+    values = np.random.default_rng(1).uniform(0, 100, len(gdf))
+    values[::13] = np.nan
+    gdf["__value__"] = values
+    return gdf
+
+
+def voronoi_layer(n: int = 2000) -> gpd.GeoDataFrame:
+    # Нерегулярные соседние полигоны: много общих границ разной длины
+    rng = np.random.default_rng(2)
+    frame = shapely.box(30, 50, 60, 80)
+    cells = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(rng.uniform((30, 50), (60, 80), (n, 2))), extend_to=frame))
+    cells = shapely.intersection(cells, frame)
+    gdf = gpd.GeoDataFrame({"name": [f"V{i:05d}" for i in range(len(cells))]}, geometry=cells, crs="EPSG:4326")
+    gdf = gdf.to_crs("EPSG:3995")
+    values = np.round(rng.uniform(0, 5, len(gdf)))
+    values[::29] = np.nan
+    gdf["__value__"] = values
+    return gdf
+
+
+BINS = MapSpec(
+    bins=[Bin(0, 25, "#fee5d9"), Bin(25, 50, "#fcae91"), Bin(50, 75, "#fb6a4a"), Bin(75, 100, "#cb181d")],
+    shared_borders=True,
+)
+EXACT = MapSpec(
+    mode="exact",
+    exact_values=[ExactValue(float(v), c) for v, c in zip(range(5), ("#edf8e9", "#bae4b3", "#74c476", "#31a354", "#006d2c"))],
+    shared_borders=True,
+)
+
+
+@dataclass
+class Case:
+    name: str
+    layer: str
+    spec: MapSpec
+    kind: str            # png | svg | png8 | partitioned
+
+
+CASES = [
+    Case("grid-bins-shared-png", "grid", BINS, "png"),
+    Case("grid-bins-stroked-png", "grid", replace(BINS, shared_borders=False), "png"),
+    Case("grid-bins-stroked-svg", "grid", replace(BINS, shared_borders=False), "svg"),
+    Case("grid-bins-png8", "grid", BINS, "png8"),
+    Case("voronoi-exact-shared-png", "voronoi", EXACT, "png"),
+    Case("voronoi-exact-shared-svg", "voronoi", EXACT, "svg"),
+    Case("voronoi-exact-legend-png", "voronoi", replace(EXACT, legend=True, legend_counts=True, legend_histogram=True), "png"),
+    Case("voronoi-exact-partitioned-png", "voronoi", replace(EXACT, shared_borders=False), "partitioned"),
+]
+LAYERS: dict[str, Callable[[], gpd.GeoDataFrame]] = {"grid": grid_layer, "voronoi": voronoi_layer}
+
+
+# ---------------------- Исходная отрисовка ----------------------
+def legacy_color(value: float, spec: MapSpec) -> str:
+    # Подбор цвета, как в исходной версии приложения: перебор интервалов или точных значений
+    if np.isnan(value):
+        return spec.no_data_color
+    if spec.mode == "bins":
+        for i, b in enumerate(spec.bins):
+            if b.contains(value, i == len(spec.bins) - 1):
+                return b.color_hex
+    else:
+        for ev in spec.exact_values:
+            if value == ev.value:
+                return ev.color_hex
+    return spec.no_data_color
+
+
+def legacy_figure(gdf: gpd.GeoDataFrame, spec: MapSpec, figsize=(6, 6)) -> Figure:
+    # Карта так, как её строила исходная версия до появления Renderer: gdf.plot с обводкой
+    # каждого полигона. Раскладка фигуры та же, что у Renderer.figure, — сравнивается отрисовка.
+    fig = Figure(figsize=figsize, dpi=100)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    colors = gdf["__value__"].apply(lambda v: legacy_color(v, spec))
+    gdf.plot(ax=ax, color=colors, edgecolor=spec.edge_color, linewidth=spec.edge_width)
+    ax.set_axis_off()
+    fig.tight_layout()
+    return fig
+
+
+def legacy_render(case: "Case", gdf: gpd.GeoDataFrame) -> bytes:
+    # Файл, который для той же схемы сохранила бы исходная версия: gdf.plot всего слоя
+    # и savefig. Общих границ, легенды и палитрового PNG в ней не было — только обводка и RGBA PNG/SVG.
+    buf = BytesIO()
+    fmt = "svg" if case.kind == "svg" else "png"
+    legacy_figure(gdf, case.spec).savefig(buf, format=fmt, dpi=DPI, bbox_inches="tight")
+    return buf.getvalue()
+
+
+# ---------------------- Отрисовка случаев ----------------------
+def render_case(case: Case, gdf: gpd.GeoDataFrame, workdir: Path) -> tuple[bytes, np.ndarray]:
+    # Возвращает файл результата и массив RGBA-цветов регионов
+    renderer = Renderer(gdf, "__value__", "name")
+    colors = renderer.colors(case.spec)
+    if case.kind == "png8":
+        return renderer.to_bytes(case.spec, "png8", dpi=DPI), colors
+    if case.kind == "partitioned":
+        source = workdir / f"{case.layer}.gpkg"
+        if not source.exists():
+            gdf[["name", "geometry"]].to_file(source)
+        layer = PartitionedLayer(str(source), "name", memory_limit=2**20, cache=LayerCache(workdir / "cache"))
+        values = value_index(gdf[["name", "__value__"]], "name", "__value__")
+        return PartitionedRenderer(layer, values).to_bytes(case.spec, "png", dpi=DPI), colors
+
+    # Тот же путь, что у кнопок «Сохранить PNG/SVG»: очередь экспорта
+    target = workdir / f"{case.name}.{case.kind}"
+    queue = ExportQueue(workers=1)
+    try:
+        (job,) = queue.submit(renderer, case.spec, [(case.kind, str(target))], dpi=DPI)
+    finally:
+        queue.shutdown(wait=True)
+    if job.status != "done":
+        raise RuntimeError(f"{case.name}: экспорт завершился со статусом {job.status}: {job.error}")
+    return target.read_bytes(), colors
+
+
+def timed(func: Callable, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+# ---------------------- Сравнение ----------------------
+def to_rgb(data: bytes) -> np.ndarray:
+    return np.asarray(Image.open(BytesIO(data)).convert("RGB"), dtype="int16")
+
+
+def pixel_diff(reference: np.ndarray, current: np.ndarray) -> float:
+    # Доля пикселей, у которых хотя бы один канал отличается больше чем на PIXEL_THRESHOLD
+    reference, current = np.asarray(reference, dtype="int16"), np.asarray(current, dtype="int16")
+    return float((np.abs(reference - current).max(axis=-1) > PIXEL_THRESHOLD).mean())
+
+
+def image_problems(data: bytes, reference: bytes) -> list[str]:
+    problems = []
+    distance = hash_distance(perceptual_hash(data), perceptual_hash(reference))
+    if distance > MAX_HASH_DISTANCE:
+        problems.append(f"перцептивный хэш: {distance} бит")
+    expected, current = to_rgb(reference), to_rgb(data)
+    if expected.shape != current.shape:
+        problems.append(f"размер {current.shape[1]}x{current.shape[0]} вместо {expected.shape[1]}x{expected.shape[0]}")
+    else:
+        diff = pixel_diff(expected, current)
+        if diff > MAX_PIXEL_DIFF:
+            problems.append(f"отличается {diff:.2%} пикселей")
+    return problems
+
+
+def perceptual_hash(data: bytes) -> str:
+    # dHash: знаки разностей соседних пикселей уменьшенного серого изображения
+    gray = Image.open(BytesIO(data)).convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = np.asarray(gray, dtype="int16")
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return np.packbits(bits).tobytes().hex()
+
+
+def hash_distance(a: str, b: str) -> int:
+    return int(np.unpackbits(np.frombuffer(bytes.fromhex(a), "uint8") ^ np.frombuffer(bytes.fromhex(b), "uint8")).sum())
+
+
+def svg_signature(data: bytes) -> dict:
+    # SVG не растрируем: сравниваем число элементов каждого вида и наборы заливок и обводок
+    root = ElementTree.fromstring(data)
+    tags = {}
+    styles = {name: {} for name in SVG_STYLE_PROPERTIES}
+    for el in root.iter():
+        tag = el.tag.rsplit("}", 1)[-1]
+        tags[tag] = tags.get(tag, 0) + 1
+        for part in el.get("style", "").split(";"):
+            key, _, value = (s.strip() for s in part.partition(":"))
+            if key in styles:
+                styles[key][value] = styles[key].get(value, 0) + 1
+    return {"tags": tags, **styles}
+
+
+def array_digest(colors: np.ndarray) -> str:
+    return hashlib.sha1(np.ascontiguousarray(colors, dtype="float64").tobytes()).hexdigest()
+
+
+def compare(case: Case, data: bytes, colors: np.ndarray, base: dict, baseline_dir: Path) -> list[str]:
+    problems = []
+    if array_digest(colors) != base["colors"]:
+        problems.append("цвета регионов отличаются")
+    if case.kind == "svg":
+        if svg_signature(data) != base["svg"]:
+            problems.append("состав SVG отличается")
+        return problems
+
+    problems += image_problems(data, (baseline_dir / base["image"]).read_bytes())
+    return problems
+
+
+# ---------------------- Запуск ----------------------
+def run(baseline_dir: Path, update: bool, repeat: int, only: Optional[str] = None, min_speedup: Optional[float] = None) -> bool:
+    baseline_file = baseline_dir / "baseline.json"
+    baseline = {} if update or not baseline_file.exists() else json.loads(baseline_file.read_text(encoding="utf-8"))
+    if not update and not baseline:
+        print(f"Эталон не найден в {baseline_dir}. Сначала запустите с --update.")
+        return False
+
+    layers = {}
+    speedups = []
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        for case in CASES:
+            if only and only not in case.name:
+                continue
+            if case.layer not in layers:
+                layers[case.layer] = LAYERS[case.layer]()
+            gdf = layers[case.layer]
+            (data, colors), seconds = timed(lambda: render_case(case, gdf, workdir), repeat)
+
+            if update:
+                entry = {"colors": array_digest(colors)}
+                if case.kind == "svg":
+                    entry["svg"] = svg_signature(data)
+                else:
+                    entry["image"] = f"{case.name}.png"
+                    baseline_dir.mkdir(parents=True, exist_ok=True)
+                    (baseline_dir / entry["image"]).write_bytes(data)
+                baseline[case.name] = entry
+                print(f"{case.name:34s} записан")
+                continue
+
+            base = baseline.get(case.name)
+            if base is None:
+                print(f"{case.name:34s} нет в эталоне")
+                continue
+            problems = compare(case, data, colors, base, baseline_dir)
+            ok = ok and not problems
+            _, legacy_seconds = timed(lambda: legacy_render(case, gdf), repeat)
+            speedup = legacy_seconds / seconds if seconds else float("inf")
+            speedups.append(speedup)
+            status = "OK  " if not problems else "FAIL"
+            print(f"{case.name:34s} {status} {seconds * 1000:8.1f} мс (gdf.plot {legacy_seconds * 1000:.1f} мс, x{speedup:.2f})")
+            for problem in problems:
+                print(f"    {problem}")
+
+    if update:
+        baseline_dir.mkdir(parents=True, exist_ok=True)
+        baseline_file.write_text(json.dumps(baseline, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Эталон сохранён в {baseline_dir}")
+    elif speedups:
+        # Среднее геометрическое: ускорения перемножаются, а не складываются
+        overall = float(np.exp(np.mean(np.log(speedups))))
+        print(f"Ускорение относительно исходной отрисовки: x{overall:.2f}")
+        if min_speedup is not None and overall < min_speedup:
+            print(f"    меньше требуемого x{min_speedup:.2f}")
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Регрессионная проверка отрисовки карт")
+    parser.add_argument("--update", action="store_true", help="записать эталон по текущей версии")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE_DIR), help="каталог эталона")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов для замера времени")
+    parser.add_argument("-k", dest="only", help="только случаи, в имени которых есть подстрока")
+    parser.add_argument("--min-speedup", type=float, help="завершиться с ошибкой, если общее ускорение меньше")
+    args = parser.parse_args()
+    sys.exit(0 if run(Path(args.baseline), args.update, args.repeat, args.only, args.min_speedup) else 1)
+
+
+if __name__ == "__main__":
+    main()
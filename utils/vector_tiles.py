@@ -0,0 +1,307 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+import gzip
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+try:
+    import mapbox_vector_tile
+except ImportError:
+    mapbox_vector_tile = None
+
+EXTENT = 4096
+BUFFER = 64
+WEB_MERCATOR_HALF = 20037508.342789244
+LAYER_NAME = "choropleth"
+MANIFEST_NAME = ".choropleth-manifest.json"
+# Больше тайлов экспорт не берётся строить: на крупных уровнях масштаба их число растёт вчетверо
+# с каждым уровнем, и слой размером со страну дал бы миллиарды тайлов
+MAX_TILES = 1_000_000
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    size = 2 * WEB_MERCATOR_HALF / 2**z
+    minx = -WEB_MERCATOR_HALF + x * size
+    maxy = WEB_MERCATOR_HALF - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tile_range(bounds, z: int) -> np.ndarray:
+    # Диапазон тайлов (x0, y0, x1, y1) для охвата или для массива охватов формы (N, 4)
+    bounds = np.asarray(bounds, dtype="float64")
+    n = 2**z
+    size = 2 * WEB_MERCATOR_HALF / n
+    columns = np.floor((bounds[..., [0, 2]] + WEB_MERCATOR_HALF) / size)
+    rows = np.floor((WEB_MERCATOR_HALF - bounds[..., [3, 1]]) / size)
+    ranges = np.stack([columns[..., 0], rows[..., 0], columns[..., 1], rows[..., 1]], axis=-1)
+    return np.clip(ranges, 0, n - 1).astype("int64")
+
+
+def _range_sizes(ranges: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    return ranges[..., 2] - ranges[..., 0] + 1, ranges[..., 3] - ranges[..., 1] + 1
+
+
+def _candidate_tiles(feature_bounds: np.ndarray, layer_bounds: np.ndarray, z: int) -> tuple[np.ndarray, np.ndarray]:
+    # Тайлы уровня z, которые задевает охват хотя бы одного объекта (с буфером тайла).
+    # Для разреженного слоя это много меньше всей сетки в охвате слоя; берётся меньший из двух наборов.
+    pad = 2 * WEB_MERCATOR_HALF / 2**z * BUFFER / EXTENT
+    ranges = tile_range(feature_bounds + [-pad, -pad, pad, pad], z)
+    widths, heights = _range_sizes(ranges)
+    counts = widths * heights
+    layer = tile_range(layer_bounds + [-pad, -pad, pad, pad], z)
+    layer_width, layer_height = _range_sizes(layer)
+    if layer_width * layer_height <= counts.sum():
+        ranges, widths, counts = layer[None, :], layer_width[None], (layer_width * layer_height)[None]
+    owner = np.repeat(np.arange(len(ranges)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    xs = ranges[owner, 0] + offset % widths[owner]
+    ys = ranges[owner, 1] + offset // widths[owner]
+    codes = np.unique(xs * 2**z + ys)
+    return codes // 2**z, codes % 2**z
+
+
+def estimate_tiles(feature_bounds: np.ndarray, layer_bounds: np.ndarray, min_zoom: int, max_zoom: int) -> int:
+    # Верхняя оценка числа непустых тайлов: по каждому уровню — меньшее из суммы
+    # тайлов по охватам объектов и числа тайлов в охвате слоя
+    total = 0
+    for z in range(min_zoom, max_zoom + 1):
+        pad = 2 * WEB_MERCATOR_HALF / 2**z * BUFFER / EXTENT
+        widths, heights = _range_sizes(tile_range(feature_bounds + [-pad, -pad, pad, pad], z))
+        layer_width, layer_height = _range_sizes(tile_range(layer_bounds + [-pad, -pad, pad, pad], z))
+        total += min(int((widths * heights).sum()), int(layer_width * layer_height))
+    return total
+
+
+def _encode_tile(bounds, wkb: list[bytes], properties: list[dict]) -> bytes:
+    # Выполняется в рабочем процессе: обрезка по тайлу с буфером, перевод в
+    # координаты тайла 0..EXTENT с округлением до целых и кодирование в MVT
+    minx, miny, maxx, maxy = bounds
+    pad = (maxx - minx) * BUFFER / EXTENT
+    geoms = shapely.from_wkb(wkb)
+    geoms = shapely.clip_by_rect(geoms, minx - pad, miny - pad, maxx + pad, maxy + pad)
+    scale = np.array([EXTENT / (maxx - minx), EXTENT / (maxy - miny)])
+    offset = np.array([minx, miny])
+    geoms = shapely.transform(geoms, lambda xy: (xy - offset) * scale)
+    geoms = shapely.set_precision(geoms, 1.0)
+
+    features = [
+        {"geometry": g, "properties": props}
+        for g, props in zip(geoms, properties)
+        if g is not None and not g.is_empty
+    ]
+    return mapbox_vector_tile.encode(
+        [{"name": LAYER_NAME, "features": features}],
+        default_options={"extents": EXTENT},
+    )
+
+
+class _DirectoryWriter:
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def load_manifest(self) -> dict:
+        try:
+            with open(self.path / MANIFEST_NAME, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write(self, z: int, x: int, y: int, data: bytes):
+        target = self.path / str(z) / str(x) / f"{y}.pbf"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_write(target, data)
+
+    def delete(self, z: int, x: int, y: int):
+        (self.path / str(z) / str(x) / f"{y}.pbf").unlink(missing_ok=True)
+
+    def finish(self, manifest: dict, metadata: dict):
+        _atomic_write(self.path / "metadata.json", json.dumps(metadata, ensure_ascii=False, indent=2).encode("utf-8"))
+        _atomic_write(self.path / MANIFEST_NAME, json.dumps(manifest).encode("utf-8"))
+
+
+class _MBTilesWriter:
+    def __init__(self, path: Path):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+            CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row);
+            CREATE TABLE IF NOT EXISTS choropleth_manifest (tile TEXT PRIMARY KEY, digest TEXT);
+            """
+        )
+
+    def load_manifest(self) -> dict:
+        return dict(self.conn.execute("SELECT tile, digest FROM choropleth_manifest"))
+
+    def write(self, z: int, x: int, y: int, data: bytes):
+        # MBTiles хранит строки в схеме TMS (ось Y снизу вверх) и сжатые gzip тайлы
+        self.conn.execute(
+            "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)",
+            (z, x, 2**z - 1 - y, gzip.compress(data)),
+        )
+
+    def delete(self, z: int, x: int, y: int):
+        self.conn.execute(
+            "DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, 2**z - 1 - y),
+        )
+
+    def finish(self, manifest: dict, metadata: dict):
+        self.conn.execute("DELETE FROM choropleth_manifest")
+        self.conn.executemany("INSERT INTO choropleth_manifest VALUES (?, ?)", manifest.items())
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO metadata VALUES (?, ?)",
+            [(k, v if isinstance(v, str) else json.dumps(v, ensure_ascii=False)) for k, v in metadata.items()],
+        )
+        self.conn.commit()
+        self.conn.close()
+
+
+def _atomic_write(target: Path, data: bytes):
+    fd, tmp = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, target)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def export_vector_tiles(
+    gdf: gpd.GeoDataFrame,
+    properties: pd.DataFrame,
+    path: str,
+    min_zoom: int = 0,
+    max_zoom: int = 8,
+    workers: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    max_tiles: int = MAX_TILES,
+) -> int:
+    # Экспорт классифицированного слоя в Mapbox Vector Tiles: каталог z/x/y.pbf
+    # или файл .mbtiles. Возвращает число перезаписанных тайлов: тайлы, у которых
+    # не изменились ни геометрия, ни атрибуты, пропускаются по манифесту.
+    if mapbox_vector_tile is None:
+        raise ValueError("Для экспорта векторных тайлов установите пакет mapbox-vector-tile.")
+    if gdf.crs is None:
+        raise ValueError("У слоя не задана система координат — экспорт тайлов невозможен.")
+    if min_zoom > max_zoom:
+        raise ValueError("Минимальный уровень масштаба больше максимального.")
+
+    merc = gdf.geometry.to_crs("EPSG:3857").values
+    valid = ~(shapely.is_missing(merc) | shapely.is_empty(merc))
+    merc = np.asarray(merc, dtype=object)
+    records = properties.astype(object).where(properties.notna(), None).to_dict("records")
+
+    if not valid.any():
+        raise ValueError("В слое нет геометрий для экспорта.")
+    feature_bounds = shapely.bounds(merc[valid])
+    bounds = shapely.total_bounds(merc[valid])
+    estimate = estimate_tiles(feature_bounds, bounds, min_zoom, max_zoom)
+    if estimate > max_tiles:
+        raise ValueError(
+            f"Слишком много тайлов: до {estimate:,} на уровнях {min_zoom}–{max_zoom} (предел {max_tiles:,}).\n"
+            "Уменьшите максимальный уровень масштаба."
+        )
+
+    geom_digest = hashlib.sha1(b"".join(shapely.to_wkb(merc[valid]))).hexdigest()
+    tree = shapely.STRtree(merc)
+
+    target = Path(path)
+    writer = _MBTilesWriter(target) if target.suffix.lower() == ".mbtiles" else _DirectoryWriter(target)
+    old_manifest = writer.load_manifest()
+    manifest: dict[str, str] = {}
+    jobs = []
+
+    for z in range(min_zoom, max_zoom + 1):
+        tile_size = 2 * WEB_MERCATOR_HALF / 2**z
+        # Упрощение на уровень: допуск в одну единицу сетки квантования тайла
+        simplified = shapely.simplify(merc, tile_size / EXTENT, preserve_topology=True)
+        # Объекты всех тайлов уровня — одним запросом к R-дереву; тайлы без объектов не создаются
+        xs, ys = _candidate_tiles(feature_bounds, bounds, z)
+        pad = tile_size * BUFFER / EXTENT
+        minx = -WEB_MERCATOR_HALF + xs * tile_size
+        maxy = WEB_MERCATOR_HALF - ys * tile_size
+        boxes = shapely.box(minx - pad, maxy - tile_size - pad, minx + tile_size + pad, maxy + pad)
+        tiles, rows = tree.query(boxes, predicate="intersects")
+        order = np.lexsort((rows, tiles))
+        tiles, rows = tiles[order], rows[order]
+        starts = np.flatnonzero(np.r_[True, tiles[1:] != tiles[:-1]]) if tiles.size else np.array([], dtype=int)
+        for tile, tile_rows in zip(tiles[starts], np.split(rows, starts[1:])):
+            tile_rows = tile_rows[valid[tile_rows]]
+            if tile_rows.size == 0:
+                continue
+            x, y = int(xs[tile]), int(ys[tile])
+            tile_props = [records[i] for i in tile_rows]
+            digest = hashlib.sha1(
+                f"{geom_digest}|{tile_rows.tobytes().hex()}|{json.dumps(tile_props, sort_keys=True, default=str)}".encode("utf-8")
+            ).hexdigest()
+            name = f"{z}/{x}/{y}"
+            manifest[name] = digest
+            if old_manifest.get(name) != digest:
+                jobs.append((z, x, y, tile_bounds(z, x, y), list(shapely.to_wkb(simplified[tile_rows])), tile_props))
+
+    for name in set(old_manifest) - set(manifest):
+        writer.delete(*map(int, name.split("/")))
+
+    lon_lat = gpd.GeoSeries(merc[valid], crs="EPSG:3857").to_crs("EPSG:4326").total_bounds
+    metadata = {
+        "name": LAYER_NAME,
+        "format": "pbf",
+        "minzoom": str(min_zoom),
+        "maxzoom": str(max_zoom),
+        "bounds": ",".join(f"{v:.6f}" for v in lon_lat),
+        "center": f"{(lon_lat[0] + lon_lat[2]) / 2:.6f},{(lon_lat[1] + lon_lat[3]) / 2:.6f},{min_zoom}",
+        "json": {
+            "vector_layers": [{
+                "id": LAYER_NAME,
+                "minzoom": min_zoom,
+                "maxzoom": max_zoom,
+                "fields": {
+                    col: "Number" if pd.api.types.is_numeric_dtype(properties[col]) else "String"
+                    for col in properties.columns
+                },
+            }]
+        },
+    }
+
+    written: set[str] = set()
+    # Рабочие процессы запускаются через spawn: экспорт вызывается из процесса с Qt и
+    # другими потоками, а fork копирует их блокировки в занятом состоянии
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        futures = [(job[:3], pool.submit(_encode_tile, *job[3:])) for job in jobs]
+        for (z, x, y), future in futures:
+            writer.write(z, x, y, future.result())
+            written.add(f"{z}/{x}/{y}")
+            if progress is not None:
+                # progress может прервать экспорт исключением (например, при отмене)
+                progress(len(written), len(jobs))
+    except BaseException:
+        pool.shutdown(wait=True, cancel_futures=True)
+        # В манифест попадают только действительно актуальные тайлы,
+        # чтобы следующий запуск достроил недописанные
+        manifest = {
+            name: digest for name, digest in manifest.items()
+            if name in written or old_manifest.get(name) == digest
+        }
+        writer.finish(manifest, metadata)
+        raise
+
+    pool.shutdown(wait=True)
+    writer.finish(manifest, metadata)
+    return len(jobs)